@@ -0,0 +1,21 @@
+"""
+gunicorn settings for serving the ASGI application with uvicorn workers:
+
+    gunicorn -c gunicorn_asgi.py travel_booking.asgi:application
+
+Async views (search, detail, the JSON endpoints) and the middleware then run on
+the event loop, and a worker keeps serving while their queries run on threads;
+sync views run in a thread per request. Like the ASGI
+application, this defaults DB_CONN_MAX_AGE to 0: persistent connections
+would be kept per async context and leak.
+"""
+import os
+
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
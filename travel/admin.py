@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TravelOption, Booking
+from .models import TravelOption, Booking, Schedule, ArchivedTravelOption, ArchivedBooking, PriceHistory
 
 @admin.register(TravelOption)
 class TravelOptionAdmin(admin.ModelAdmin):
@@ -10,3 +10,23 @@ class TravelOptionAdmin(admin.ModelAdmin):
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('booking_id', 'user', 'travel_option', 'number_of_seats', 'total_price', 'status', 'booking_date')
     list_filter = ('status',)
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ('code', 'type', 'source', 'destination', 'departure_time', 'weekdays', 'price', 'capacity', 'active', 'materialized_until')
+    list_filter = ('type', 'active')
+
+@admin.register(ArchivedTravelOption)
+class ArchivedTravelOptionAdmin(admin.ModelAdmin):
+    list_display = ('travel_id', 'type', 'source', 'destination', 'departure_datetime', 'price', 'archived_at')
+    list_filter = ('type',)
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('booking_id', 'user', 'travel_option', 'number_of_seats', 'total_price', 'status', 'booking_date')
+    list_filter = ('status',)
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('travel_option_id', 'source', 'destination', 'recorded_at', 'price')
+    search_fields = ('=travel_option_id', 'source', 'destination')
@@ -1,13 +1,32 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Count, Sum, Q, Avg, F
+from django.db.models import Count, Sum, Q, Avg, F, Max, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.models import User
-from .models import Booking, TravelOption
+from .models import Booking, BookingRollup, TravelOption
+from .utils.archive import merged_counts, rollup_totals
+from .utils.slow_queries import slow_log, threshold_ms
 from decimal import Decimal
 
 
+def _money(expression):
+    return Coalesce(expression, Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _with_archived_totals(users, confirmed_only=True):
+    """Annotate booking_count/total_spent over live bookings plus the user's archive rollup"""
+    live = Q(booking__status='CONFIRMED') if confirmed_only else Q()
+    archived = 'booking_rollup__confirmed' if confirmed_only else 'booking_rollup__bookings'
+    # booking_rollup is one row per user, so the join doesn't multiply the booking rows
+    return users.annotate(
+        booking_count=Count('booking', filter=live) + Coalesce(Max(archived), 0),
+        total_spent=_money(Sum('booking__total_price', filter=Q(booking__status='CONFIRMED')))
+        + _money(Max('booking_rollup__spent')),
+    )
+
+
 def superuser_required(function):
     """Decorator to ensure only superusers can access admin views"""
     actual_decorator = user_passes_test(
@@ -27,9 +46,14 @@ def admin_dashboard(request):
     month_ago = today - timedelta(days=30)
     
     # === BOOKING STATISTICS ===
-    total_bookings = Booking.objects.count()
-    confirmed_bookings = Booking.objects.filter(status='CONFIRMED').count()
-    cancelled_bookings = Booking.objects.filter(status='CANCELLED').count()
+    # All-time figures add the rollups of archived bookings; the windowed
+    # ones below only ever see live rows (see utils/archive.py)
+    archived = rollup_totals()
+    archived_confirmed = archived.get('CONFIRMED', {})
+    archived_cancelled = archived.get('CANCELLED', {})
+    total_bookings = Booking.objects.count() + sum(row['bookings'] for row in archived.values())
+    confirmed_bookings = Booking.objects.filter(status='CONFIRMED').count() + archived_confirmed.get('bookings', 0)
+    cancelled_bookings = Booking.objects.filter(status='CANCELLED').count() + archived_cancelled.get('bookings', 0)
     pending_bookings = Booking.objects.filter(status='PENDING').count()
     
     # Today's bookings
@@ -42,9 +66,9 @@ def admin_dashboard(request):
     month_bookings = Booking.objects.filter(booking_date__gte=month_ago).count()
     
     # === REVENUE STATISTICS ===
-    total_revenue = Booking.objects.filter(status='CONFIRMED').aggregate(
+    total_revenue = (Booking.objects.filter(status='CONFIRMED').aggregate(
         total=Sum('total_price')
-    )['total'] or Decimal('0')
+    )['total'] or Decimal('0')) + archived_confirmed.get('revenue', Decimal('0'))
     
     week_revenue = Booking.objects.filter(
         status='CONFIRMED', 
@@ -61,6 +85,7 @@ def admin_dashboard(request):
         status='CANCELLED',
         refund_amount__isnull=False
     ).aggregate(total=Sum('refund_amount'))['total'] or Decimal('0')
+    total_refunds += archived_cancelled.get('refunds') or Decimal('0')
     
     # === USER STATISTICS ===
     total_users = User.objects.count()
@@ -75,15 +100,36 @@ def admin_dashboard(request):
     total_travel_options = TravelOption.objects.count()
     
     # Bookings by travel type
-    bookings_by_type = Booking.objects.filter(status='CONFIRMED').values(
+    live_by_type = Booking.objects.filter(status='CONFIRMED').values_list(
         'travel_option__type'
-    ).annotate(count=Count('id')).order_by('-count')
+    ).annotate(count=Count('id')).order_by()
+    archived_by_type = BookingRollup.objects.filter(status='CONFIRMED').values_list(
+        'type'
+    ).annotate(count=Sum('bookings')).order_by()
+    bookings_by_type = [
+        {'travel_option__type': ttype, 'count': count}
+        for (ttype,), count in merged_counts(
+            {tuple(key): count for *key, count in live_by_type},
+            {tuple(key): count for *key, count in archived_by_type},
+        )
+    ]
     
     # Popular routes
-    popular_routes = Booking.objects.filter(status='CONFIRMED').values(
+    live_routes = Booking.objects.filter(status='CONFIRMED').values_list(
         'travel_option__source',
         'travel_option__destination'
-    ).annotate(count=Count('id')).order_by('-count')[:10]
+    ).annotate(count=Count('id')).order_by()
+    archived_routes = BookingRollup.objects.filter(status='CONFIRMED').values_list(
+        'source', 'destination'
+    ).annotate(count=Sum('bookings')).order_by()
+    popular_routes = [
+        {'travel_option__source': source, 'travel_option__destination': destination, 'count': count}
+        for (source, destination), count in merged_counts(
+            {tuple(key): count for *key, count in live_routes},
+            {tuple(key): count for *key, count in archived_routes},
+            limit=10,
+        )
+    ]
     
     # === RECENT ACTIVITY ===
     recent_bookings = Booking.objects.select_related(
@@ -95,10 +141,9 @@ def admin_dashboard(request):
     ).select_related('user', 'travel_option').order_by('-cancelled_at')[:5]
     
     # === TOP USERS ===
-    top_users = User.objects.annotate(
-        booking_count=Count('booking', filter=Q(booking__status='CONFIRMED')),
-        total_spent=Sum('booking__total_price', filter=Q(booking__status='CONFIRMED'))
-    ).filter(booking_count__gt=0).order_by('-total_spent')[:10]
+    top_users = _with_archived_totals(User.objects.all()).filter(
+        booking_count__gt=0
+    ).order_by('-total_spent')[:10]
     
     # === AVAILABILITY STATISTICS ===
     low_availability = TravelOption.objects.filter(
@@ -107,27 +152,28 @@ def admin_dashboard(request):
     ).order_by('available_seats')[:10]
     
     # === CHART DATA ===
-    # Bookings trend (last 7 days)
+    # Bookings and revenue trend (last 7 days), one grouped query
+    trend_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+    trend_rows = {
+        row['day']: row
+        for row in Booking.objects.filter(booking_date__date__gte=trend_days[0]).annotate(
+            day=TruncDate('booking_date')
+        ).values('day').annotate(
+            count=Count('id'),
+            revenue=Sum('total_price', filter=Q(status='CONFIRMED')),
+        ).order_by()
+    }
     bookings_trend = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        count = Booking.objects.filter(booking_date__date=date).count()
+    revenue_trend = []
+    for date in trend_days:
+        row = trend_rows.get(date, {})
         bookings_trend.append({
             'date': date.strftime('%b %d'),
-            'count': count
+            'count': row.get('count', 0)
         })
-    
-    # Revenue trend (last 7 days)
-    revenue_trend = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        revenue = Booking.objects.filter(
-            status='CONFIRMED',
-            booking_date__date=date
-        ).aggregate(total=Sum('total_price'))['total'] or Decimal('0')
         revenue_trend.append({
             'date': date.strftime('%b %d'),
-            'revenue': float(revenue)
+            'revenue': float(row.get('revenue') or 0)
         })
     
     context = {
@@ -209,10 +255,7 @@ def admin_bookings(request):
 @superuser_required
 def admin_users(request):
     """Admin view for managing users"""
-    users = User.objects.annotate(
-        booking_count=Count('booking'),
-        total_spent=Sum('booking__total_price', filter=Q(booking__status='CONFIRMED'))
-    ).order_by('-date_joined')
+    users = _with_archived_totals(User.objects.all(), confirmed_only=False).order_by('-date_joined')
     
     # Search
     search = request.GET.get('search')
@@ -258,3 +301,22 @@ def admin_travel_options(request):
         'destination': destination,
     }
     return render(request, 'travel/admin/travel_options.html', context)
+
+
+@superuser_required
+def admin_slow_queries(request):
+    """Recent slow queries of this worker process with their EXPLAIN plans"""
+    if request.method == 'POST':
+        slow_log.clear()
+        return redirect('travel:admin_slow_queries')
+
+    entries = slow_log.entries()
+    if request.GET.get('full_scans'):
+        entries = [e for e in entries if e['full_scans']]
+
+    context = {
+        'entries': entries,
+        'threshold_ms': threshold_ms(),
+        'full_scans_only': bool(request.GET.get('full_scans')),
+    }
+    return render(request, 'travel/admin/slow_queries.html', context)
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 class TravelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'travel'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .utils.slow_queries import install
+
+        connection_created.connect(install, dispatch_uid='travel.slow_query_log')
@@ -0,0 +1,92 @@
+"""
+Primary/replica database routing.
+
+Reads go to the replica only while a view listed in REPLICA_READ_VIEWS is
+serving a GET or HEAD request (ReplicaRoutingMiddleware turns that on).
+Everything else stays on the primary: writes, reads inside a transaction,
+reads after the request has written anything, sessions, and every request
+of a client that wrote within the last REPLICA_PIN_SECONDS (the middleware
+pins it with a cookie so it reads its own writes despite replication lag).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+
+# Never read from the replica: a lagging session table would log users out
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# Routing state of the current request: {'replica': bool, 'wrote': bool}
+_routing = ContextVar('travel_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def replica_read_views():
+    return getattr(settings, 'REPLICA_READ_VIEWS', ())
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 15)
+
+
+@contextmanager
+def routing(replica=False):
+    """Track writes, and route reads to the replica when ``replica`` is true"""
+    state = {'replica': replica, 'wrote': False}
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def replica_reads():
+    """Read from the replica, e.g. in a reporting command; writes still pin to the primary"""
+    return routing(replica=True)
+
+
+def _in_transaction():
+    # Ignore the atomic blocks TestCase wraps around each test
+    return any(
+        not getattr(block, '_from_testcase', False)
+        for block in connections[DEFAULT_DB_ALIAS].atomic_blocks
+    )
+
+
+class PrimaryReplicaRouter:
+    """Installed even without a replica, so writes are still tracked for pinning"""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is None
+            or not state['replica']
+            or state['wrote']
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or not replica_configured()
+            or _in_transaction()
+        ):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return False if db == REPLICA_DB_ALIAS else None
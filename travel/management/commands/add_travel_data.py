@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import datetime, timedelta
 from travel.models import TravelOption
+from travel.utils import fare_calendar
 import random
 
 class Command(BaseCommand):
@@ -121,6 +122,8 @@ class Command(BaseCommand):
         
         # Bulk create travel options
         TravelOption.objects.bulk_create(travel_options)
+        # bulk_create skips signals, so refresh the precomputed fare calendar
+        fare_calendar.rebuild()
         
         # Print summary
         if travel_type:
@@ -0,0 +1,46 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from travel.utils.archive import ARCHIVE_MIN_DAYS, archive_chunk
+from travel.utils.autocomplete import cities
+import time
+
+
+class Command(BaseCommand):
+    help = ('Move departures older than --days, with their bookings, into the archive tables in '
+            'chunked transactions; safe to interrupt and re-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help=f'Archive departures that left more than this many days ago (min {ARCHIVE_MIN_DAYS})')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Departures per transaction')
+        parser.add_argument('--max-chunks', type=int, default=0, help='Stop after this many chunks (0: no limit)')
+
+    def handle(self, *args, **options):
+        if options['days'] < ARCHIVE_MIN_DAYS:
+            raise CommandError(f'--days must be at least {ARCHIVE_MIN_DAYS}: the dashboard reads the last '
+                               f'30 days from live bookings')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        before = timezone.now() - timedelta(days=options['days'])
+        self.stdout.write(f'Archiving departures before {before:%Y-%m-%d %H:%M}')
+
+        departures = bookings = chunks = 0
+        started = time.perf_counter()
+        while not options['max_chunks'] or chunks < options['max_chunks']:
+            moved, moved_bookings = archive_chunk(before, options['chunk_size'])
+            if not moved:
+                break
+            chunks += 1
+            departures += moved
+            bookings += moved_bookings
+            elapsed = time.perf_counter() - started
+            rate = (departures + bookings) / elapsed if elapsed else 0
+            self.stdout.write(f'  {departures:,} departures, {bookings:,} bookings ({rate:,.0f} rows/s)')
+
+        if departures:
+            # Rows were removed with plain DELETEs, which send no signals
+            cities.invalidate(time.monotonic())
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {departures:,} departures and {bookings:,} bookings in {chunks} chunks'
+        ))
@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from travel.models import TravelOption
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+# gunicorn hook run in every worker: add a fixed delay to each query so the
+# database behaves like one across a network (the I/O-bound case)
+LATENCY_HOOK = '''
+import os
+import time
+
+def post_worker_init(worker):
+    delay = float(os.environ.get('BENCH_QUERY_LATENCY_MS', '0')) / 1000
+    if not delay:
+        return
+    from django.db.backends.signals import connection_created
+
+    def slow(execute, sql, params, many, context):
+        time.sleep(delay)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.insert(0, slow)
+
+    connection_created.connect(install, weak=False)
+'''
+
+SERVERS = [
+    ('sync (WSGI)', 'travel_booking.wsgi:application', 'sync'),
+    ('uvicorn (ASGI)', 'travel_booking.asgi:application', 'uvicorn_worker.UvicornWorker'),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Serve the app with sync gunicorn workers and with uvicorn workers, drive both with '
+            'many concurrent connections, and compare throughput and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for both servers')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per server')
+        parser.add_argument('--query-latency-ms', type=float, default=10.0,
+                            help='Delay added to every query in the servers, modelling a networked database; '
+                                 '0 measures the CPU-bound case')
+
+    def handle(self, *args, **options):
+        travel = TravelOption.objects.order_by('pk').first()
+        if travel is None:
+            raise CommandError('No travel options; run populate_travel_data first')
+        paths = [
+            '/travel/',
+            f'/travel/{travel.pk}/',
+            f'/travel/?{urlencode({"source": travel.source})}',
+            f'/travel/autocomplete/?{urlencode({"q": travel.source[:2]})}',
+        ]
+
+        self.stdout.write(f'{options["concurrency"]} connections x {options["duration"]:.0f}s, '
+                          f'{options["workers"]} workers, +{options["query_latency_ms"]} ms per query')
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, 'bench_gunicorn.py')
+            with open(config, 'w') as fh:
+                fh.write(LATENCY_HOOK)
+            for label, app, worker_class in SERVERS:
+                port = free_port()
+                server = self.start_server(config, app, worker_class, port, options)
+                try:
+                    timings, errors = self.load(port, paths, options)
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+                self.report(label, timings, errors, options['duration'])
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def start_server(self, config, app, worker_class, port, options):
+        env = dict(
+            os.environ, DEBUG='0', ALLOWED_HOSTS='127.0.0.1', QUERY_INSPECTOR_ENABLED='0',
+            SLOW_QUERY_LOG_ENABLED='0', BENCH_QUERY_LATENCY_MS=str(options['query_latency_ms']),
+        )
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', config, app, '--bind', f'127.0.0.1:{port}',
+             '--workers', str(options['workers']), '--worker-class', worker_class, '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{app} failed to start:\n{server.stderr.read()[-2000:]}')
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                conn.request('GET', '/travel/')
+                conn.getresponse().read()
+                conn.close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'{app} did not answer within 30s')
+
+    def load(self, port, paths, options):
+        deadline = time.monotonic() + options['duration']
+
+        def client(index):
+            timings, errors = [], 0
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            i = index
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        errors += 1
+                    else:
+                        timings.append((time.perf_counter() - started) * 1000)
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.close()
+            return timings, errors
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(client, range(options['concurrency'])))
+        timings = sorted(t for result in results for t in result[0])
+        return timings, sum(result[1] for result in results)
+
+    def report(self, label, timings, errors, duration):
+        if not timings:
+            self.stdout.write(f'  {label:<15} no successful requests ({errors} errors)')
+            return
+        self.stdout.write(
+            f'  {label:<15} {len(timings) / duration:8.1f} req/s  '
+            f'p50 {statistics.median(timings):7.1f} ms  '
+            f'p95 {timings[max(int(len(timings) * 0.95) - 1, 0)]:7.1f} ms  '
+            f'errors {errors}'
+        )
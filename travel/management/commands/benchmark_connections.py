@@ -0,0 +1,78 @@
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = ('Compare request latency with per-request database connections (CONN_MAX_AGE=0) '
+            'and persistent connections with health checks, through the full WSGI handler')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per mode')
+        parser.add_argument('--path', default='/travel/', help='Page to request')
+        parser.add_argument('--database', default='default', help='Database alias to reconfigure')
+        parser.add_argument(
+            '--connect-latency-ms', type=float, default=0.0,
+            help='Extra delay added to every new connection, to stand in for a networked MySQL '
+                 'handshake when benchmarking against SQLite',
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        handler = WSGIHandler()
+        opened = []
+
+        def on_connect(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(1)
+                if options['connect_latency_ms']:
+                    time.sleep(options['connect_latency_ms'] / 1000)
+
+        def request():
+            environ = {'PATH_INFO': options['path'], 'REQUEST_METHOD': 'GET', 'wsgi.input': BytesIO()}
+            setup_testing_defaults(environ)
+            environ['HTTP_HOST'] = 'localhost'
+            statuses = []
+            started = time.perf_counter()
+            body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            for _ in body:
+                pass
+            body.close()  # fires request_finished, which closes or keeps the connection
+            elapsed = (time.perf_counter() - started) * 1000
+            if not statuses[0].startswith('200'):
+                raise RuntimeError(f'{options["path"]} returned {statuses[0]}')
+            return elapsed
+
+        settings_dict = connections[alias].settings_dict
+        original = settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS']
+        connection_created.connect(on_connect)
+        results = {}
+        try:
+            with override_settings(QUERY_INSPECTOR_ENABLED=False):
+                for label, max_age, health_checks in [('per-request', 0, False), ('persistent', 600, True)]:
+                    connections[alias].close()
+                    settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'] = max_age, health_checks
+                    request()  # warm up templates and caches
+                    opened.clear()
+                    timings = sorted(request() for _ in range(options['requests']))
+                    results[label] = (timings, len(opened))
+        finally:
+            connection_created.disconnect(on_connect)
+            connections[alias].close()
+            settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'] = original
+
+        self.stdout.write(f'{options["requests"]} x GET {options["path"]} on "{alias}" '
+                          f'({connections[alias].vendor}, +{options["connect_latency_ms"]} ms per connect)')
+        for label, (timings, connects) in results.items():
+            reuse = 1 - connects / len(timings)
+            self.stdout.write(
+                f'  {label:<12} p50 {statistics.median(timings):6.2f} ms  '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:6.2f} ms  '
+                f'connections opened {connects:>4}  reuse {reuse:6.1%}'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
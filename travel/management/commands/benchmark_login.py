@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = 'Benchmark login throughput and queries per login (all writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Number of logins to perform')
+        parser.add_argument(
+            '--real-hasher',
+            action='store_true',
+            help='Use the configured password hashers instead of a fast one; '
+                 'by default MD5 is used so the numbers reflect request and database cost',
+        )
+
+    def handle(self, *args, **options):
+        settings_override = {'ALLOWED_HOSTS': ['testserver']}
+        if not options['real_hasher']:
+            settings_override['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        with override_settings(**settings_override), transaction.atomic():
+            User.objects.create_user(username='__bench_login__', password='bench-pass')
+            url = reverse('travel:login')
+            credentials = {'username': '__bench_login__', 'password': 'bench-pass'}
+
+            timings = []
+            query_counts = []
+            for _ in range(options['iterations']):
+                client = Client()
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = client.post(url, credentials)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 302:
+                    self.stderr.write(self.style.ERROR(f'Login failed with status {response.status_code}'))
+                    transaction.set_rollback(True)
+                    return
+                query_counts.append(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]))
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        total_seconds = sum(timings) / 1000
+        self.stdout.write(f'Logins:            {len(timings)}')
+        self.stdout.write(f'Throughput:        {len(timings) / total_seconds:.1f} logins/sec')
+        self.stdout.write(f'Latency p50/p95:   {statistics.median(timings):.2f} / {timings[int(len(timings) * 0.95) - 1]:.2f} ms')
+        self.stdout.write(f'Queries per login: {statistics.mean(query_counts):.1f}')
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
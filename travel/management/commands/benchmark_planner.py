@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from travel.utils.connections import ConnectionGraph, Leg
+import random
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = 'Benchmark the connection planner against a synthetic in-memory departure set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departures', type=int, default=100000, help='Number of departures to generate')
+        parser.add_argument('--stations', type=int, default=300, help='Number of stations')
+        parser.add_argument('--hubs', type=int, default=15, help='Number of hub stations that attract traffic')
+        parser.add_argument('--days', type=int, default=14, help='Horizon the departures are spread over')
+        parser.add_argument('--queries', type=int, default=500, help='Number of random searches to run')
+        parser.add_argument('--max-legs', type=int, default=3)
+        parser.add_argument('--budget-ms', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        stations = [f'Station {i:04d}' for i in range(options['stations'])]
+        hubs = stations[:options['hubs']]
+        horizon = options['days'] * 86400
+        start = time.time()
+
+        # Roughly half the traffic touches a hub, like a real hub-and-spoke network
+        legs = []
+        for pk in range(1, options['departures'] + 1):
+            source = rng.choice(hubs if rng.random() < 0.3 else stations)
+            destination = rng.choice(hubs if rng.random() < 0.3 else stations)
+            while destination == source:
+                destination = rng.choice(stations)
+            ttype = rng.choice(['FLIGHT', 'TRAIN', 'BUS'])
+            departs = start + rng.uniform(0, horizon)
+            hours = {'FLIGHT': rng.uniform(1, 4), 'TRAIN': rng.uniform(2, 10), 'BUS': rng.uniform(2, 12)}[ttype]
+            legs.append(Leg(
+                pk=pk, travel_id=f'SYN{pk}', type=ttype, source=source, destination=destination,
+                departs=departs, arrives=departs + hours * 3600,
+                price=round(rng.uniform(20, 800), 2), seats=rng.randint(0, 200),
+            ))
+
+        graph = ConnectionGraph()
+        t0 = time.perf_counter()
+        graph.bulk_load(legs)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        # Incremental refresh cost: re-add 1% of the departures
+        t0 = time.perf_counter()
+        for leg in rng.sample(legs, max(1, len(legs) // 100)):
+            graph.add(leg)
+        update_us = (time.perf_counter() - t0) * 1e6 / max(1, len(legs) // 100)
+
+        timings = []
+        found = truncated = 0
+        for _ in range(options['queries']):
+            source, destination = rng.sample(stations, 2)
+            result = graph.search(
+                source, destination, start + rng.uniform(0, horizon / 2),
+                max_legs=options['max_legs'], min_transfer=45 * 60,
+                max_wait=24 * 3600, budget_ms=options['budget_ms'],
+            )
+            timings.append(result.elapsed_ms)
+            found += bool(result.fastest or result.cheapest)
+            truncated += result.truncated
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'Departures:        {len(graph)}')
+        self.stdout.write(f'Graph build:       {build_ms:.1f} ms')
+        self.stdout.write(f'Incremental add:   {update_us:.1f} us/departure')
+        self.stdout.write(f'Queries:           {len(timings)} ({found} with a result, {truncated} hit the budget)')
+        self.stdout.write(f'Latency p50/p95:   {statistics.median(timings):.2f} / {p95:.2f} ms (max {timings[-1]:.2f} ms)')
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pathlib import Path
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Libraries that must only be imported when a PDF is rendered
+LAZY_MODULES = ('reportlab', 'qrcode', 'PIL')
+
+# Runs in a fresh interpreter: what a gunicorn worker does before serving
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = (time.perf_counter() - started) * 1000
+rss_kb = 0
+try:
+    with open('/proc/self/status') as fh:
+        rss_kb = next(int(line.split()[1]) for line in fh if line.startswith('VmRSS:'))
+except (OSError, StopIteration):
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'setup_ms': elapsed,
+    'rss_mb': rss_kb / 1024,
+    'lazy_loaded': sorted(m for m in %r if m in sys.modules),
+}))
+''' % (LAZY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """Cumulative microseconds per top-level import from ``-X importtime`` output"""
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith(' ') or name.startswith('  '):
+            continue  # nested import, already counted in its parent
+        top_level[name.strip()] = top_level.get(name.strip(), 0) + int(cumulative)
+    return top_level
+
+
+class Command(BaseCommand):
+    help = ('Measure worker startup: import time (python -X importtime) and RSS after django.setup() '
+            'and URL loading, compared against a saved baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to start; medians are reported')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'startup.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative increase over the baseline before failing')
+        parser.add_argument('--top', type=int, default=10, help='Number of slowest top-level imports to list')
+
+    def probe(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'travel_booking.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup probe failed:\n{result.stderr[-2000:]}')
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        data['imports'] = parse_importtime(result.stderr)
+        data['import_ms'] = sum(data['imports'].values()) / 1000
+        return data
+
+    def handle(self, *args, **options):
+        runs = [self.probe() for _ in range(options['runs'])]
+        results = {
+            'import_ms': statistics.median(r['import_ms'] for r in runs),
+            'setup_ms': statistics.median(r['setup_ms'] for r in runs),
+            'rss_mb': statistics.median(r['rss_mb'] for r in runs),
+        }
+        lazy_loaded = runs[-1]['lazy_loaded']
+
+        self.stdout.write(f'Runs:                 {len(runs)}')
+        self.stdout.write(f'Import time (total):  {results["import_ms"]:.1f} ms')
+        self.stdout.write(f'Setup + URL loading:  {results["setup_ms"]:.1f} ms')
+        self.stdout.write(f'RSS after setup:      {results["rss_mb"]:.1f} MB')
+        self.stdout.write(f'PDF libraries loaded: {", ".join(lazy_loaded) or "none"}')
+        self.stdout.write('Slowest top-level imports:')
+        slowest = sorted(runs[-1]['imports'].items(), key=lambda item: -item[1])[:options['top']]
+        for name, micros in slowest:
+            self.stdout.write(f'  {micros / 1000:8.1f} ms  {name}')
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({k: round(v, 1) for k, v in results.items()}, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+            return
+
+        problems = []
+        if lazy_loaded:
+            problems.append(f'{", ".join(lazy_loaded)} imported at startup')
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            for key, value in results.items():
+                limit = baseline.get(key, 0) * (1 + options['tolerance'])
+                if baseline.get(key) and value > limit:
+                    problems.append(f'{key} {value:.1f} exceeds baseline {baseline[key]} (+{options["tolerance"]:.0%})')
+        else:
+            self.stdout.write(f'No baseline at {baseline_path}; run with --save-baseline to create one')
+
+        if problems:
+            raise CommandError('Startup regression: ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,200 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pathlib import Path
+from travel.models import TravelOption, Booking
+import json
+import statistics
+import time
+import tracemalloc
+
+# Compared against the baseline: (key, tolerance option)
+CHECKS = [
+    ('p50_ms', 'tolerance'),
+    ('p95_ms', 'tolerance'),
+    ('alloc_kb', 'alloc_tolerance'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the main views through the test client against the current dataset '
+            '(see generate_dataset): p50/p95 latency, query count and peak allocations per request, '
+            'compared against a saved JSON baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per view')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per view first')
+        parser.add_argument('--alloc-runs', type=int, default=3, help='Requests per view under tracemalloc')
+        parser.add_argument('--only', nargs='*', help='Benchmark only these scenarios')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'views.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative latency increase over the baseline before failing')
+        parser.add_argument('--alloc-tolerance', type=float, default=0.25,
+                            help='Allowed relative increase in peak allocations before failing')
+        parser.add_argument('--query-tolerance', type=int, default=0,
+                            help='Extra queries per request allowed over the baseline')
+
+    def handle(self, *args, **options):
+        self.options = options
+        overrides = dict(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            QUERY_INSPECTOR_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False, PROFILER_ENABLED=False,
+        )
+        # Everything, including the benchmark users and every booking made or
+        # cancelled, is rolled back at the end so the dataset stays as generated
+        results = {}
+        try:
+            with override_settings(**overrides), transaction.atomic():
+                for name, run in self.scenarios():
+                    if options['only'] and name not in options['only']:
+                        continue
+                    results[name] = self.measure(run)
+                    self.report(name, results[name])
+                raise Rollback
+        except Rollback:
+            pass
+        dataset = {'travel_options': TravelOption.objects.count(), 'bookings': Booking.objects.count()}
+        self.compare(results, dataset)
+
+    def scenarios(self):
+        now = timezone.now()
+        booking = (
+            Booking.objects.filter(status='CONFIRMED', travel_option__departure_datetime__gt=now + timedelta(days=2))
+            .select_related('user', 'travel_option').order_by('pk').first()
+        )
+        travel = (
+            TravelOption.objects.filter(departure_datetime__gt=now + timedelta(days=2), available_seats__gte=5)
+            .order_by('departure_datetime', 'pk').first()
+        )
+        if booking is None or travel is None:
+            raise CommandError('No upcoming bookings or departures; run generate_dataset first')
+        day = travel.departure_datetime.date().isoformat()
+
+        traveller = Client()
+        traveller.force_login(booking.user)
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('bench-admin', 'bench-admin@example.com', None))
+        anonymous = Client()
+
+        def get(client, url, status=200):
+            return lambda: self.request(client.get, url, status)
+
+        def post(client, url, data):
+            # Each write runs in a savepoint that is rolled back, so every
+            # iteration books or cancels the same seats again
+            def run():
+                with transaction.atomic():
+                    self.request(client.post, url, 302, data)
+                    transaction.set_rollback(True)
+            return run
+
+        list_url = reverse('travel:list')
+        return [
+            ('index', get(anonymous, reverse('travel:index'))),
+            ('travel_list', get(anonymous, list_url)),
+            ('travel_list_source', get(anonymous, f'{list_url}?source={travel.source}')),
+            ('travel_list_route', get(anonymous, f'{list_url}?source={travel.source}&destination={travel.destination}')),
+            ('travel_list_type_date', get(anonymous, f'{list_url}?type={travel.type}&date={day}')),
+            ('travel_list_flex', get(anonymous, f'{list_url}?date={day}&flex=3')),
+            ('travel_list_price', get(anonymous, f'{list_url}?sort=price&max_price=150')),
+            ('travel_detail', get(anonymous, reverse('travel:detail', args=[travel.pk]))),
+            ('book_travel_form', get(traveller, reverse('travel:book', args=[travel.pk]))),
+            ('book_travel', post(traveller, reverse('travel:book', args=[travel.pk]), {'number_of_seats': 2})),
+            ('my_bookings', get(traveller, reverse('travel:my_bookings'))),
+            ('cancel_booking_form', get(traveller, reverse('travel:cancel_booking', args=[booking.pk]))),
+            ('cancel_booking', post(traveller, reverse('travel:cancel_booking', args=[booking.pk]), {})),
+            ('download_ticket', get(traveller, reverse('travel:download_ticket', args=[booking.pk]))),
+            ('user_profile', get(traveller, reverse('travel:user_profile'))),
+            ('edit_profile', get(traveller, reverse('travel:edit_profile'))),
+            ('booking_history', get(traveller, reverse('travel:booking_history'))),
+            ('admin_dashboard', get(admin, reverse('travel:admin_dashboard'))),
+        ]
+
+    def request(self, method, url, status, data=None):
+        response = method(url, data) if data is not None else method(url)
+        if response.status_code != status:
+            raise CommandError(f'{url} returned {response.status_code}, expected {status}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+    def measure(self, run):
+        for _ in range(self.options['warmup']):
+            run()
+
+        timings, queries = [], []
+        for _ in range(self.options['iterations']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        timings.sort()
+
+        # Separate pass: tracemalloc slows every allocation down
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(self.options['alloc_runs']):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                run()
+                peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 2),
+            'queries': max(queries),
+            'alloc_kb': round(statistics.median(peaks), 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'  {name:<24} p50 {result["p50_ms"]:8.2f} ms  p95 {result["p95_ms"]:8.2f} ms  '
+            f'queries {result["queries"]:>3}  peak alloc {result["alloc_kb"]:9.1f} KB'
+        )
+
+    def compare(self, results, dataset):
+        options = self.options
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({'dataset': dataset, 'views': results}, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f'No baseline at {baseline_path}; run with --save-baseline to create one')
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('dataset') != dataset:
+            self.stdout.write(self.style.WARNING(
+                f'Dataset differs from the baseline ({baseline.get("dataset")}); timings may not be comparable'
+            ))
+        problems = []
+        for name, result in results.items():
+            expected = baseline['views'].get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries'] + options['query_tolerance']:
+                problems.append(f'{name}: {result["queries"]} queries, baseline {expected["queries"]}')
+            for key, tolerance in CHECKS:
+                limit = expected[key] * (1 + options[tolerance])
+                if result[key] > limit:
+                    problems.append(f'{name}: {key} {result[key]} exceeds baseline {expected[key]} '
+                                    f'(+{options[tolerance]:.0%})')
+        if problems:
+            raise CommandError('View regressions:\n  ' + '\n  '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
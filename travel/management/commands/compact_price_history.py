@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from travel.utils.price_history import downsample
+import time
+
+
+class Command(BaseCommand):
+    help = ('Downsample price history older than --days to the lowest and the last price per departure '
+            'and day')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep every change from the last this many days')
+        parser.add_argument('--window-days', type=int, default=7,
+                            help='Only look at this many days before the cutoff (0: all older history)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per read and per delete')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['window_days'] < 0:
+            raise CommandError('--days must be positive and --window-days not negative')
+        # Cut on local midnight so no day is split between full and daily resolution
+        midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        before = midnight - timedelta(days=options['days'])
+        after = before - timedelta(days=options['window_days']) if options['window_days'] else None
+
+        started = time.perf_counter()
+        deleted = downsample(before, after, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {deleted:,} price history rows recorded before {before:%Y-%m-%d} '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,274 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from travel.models import TravelOption, Booking
+from travel.utils import fare_calendar
+import bisect
+import itertools
+import math
+import random
+import time
+import uuid
+
+CITY_NAMES = [
+    'New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio',
+    'San Diego', 'Dallas', 'San Jose', 'Austin', 'Jacksonville', 'Fort Worth', 'Columbus',
+    'Charlotte', 'San Francisco', 'Indianapolis', 'Seattle', 'Denver', 'Washington DC', 'Boston',
+    'El Paso', 'Nashville', 'Detroit', 'Oklahoma City', 'Portland', 'Las Vegas', 'Memphis',
+    'Louisville', 'Baltimore', 'Milwaukee', 'Albuquerque', 'Tucson', 'Fresno', 'Sacramento',
+    'Kansas City', 'Mesa', 'Atlanta', 'Omaha', 'Colorado Springs', 'Raleigh', 'Miami',
+    'Long Beach', 'Virginia Beach', 'Oakland', 'Minneapolis', 'Tulsa', 'Tampa', 'Arlington',
+    'New Orleans', 'Wichita', 'Cleveland', 'Bakersfield', 'Aurora', 'Anaheim', 'Honolulu',
+    'Santa Ana', 'Riverside', 'Corpus Christi', 'Lexington', 'Stockton', 'Henderson', 'Saint Paul',
+    'St. Louis', 'Cincinnati', 'Pittsburgh', 'Greensboro', 'Anchorage', 'Plano', 'Lincoln',
+    'Orlando', 'Irvine', 'Newark', 'Toledo', 'Durham', 'Chula Vista', 'Fort Wayne', 'Jersey City',
+    'St. Petersburg', 'Laredo', 'Madison', 'Chandler', 'Buffalo', 'Lubbock', 'Scottsdale', 'Reno',
+    'Glendale', 'Gilbert', 'Winston-Salem', 'North Las Vegas', 'Norfolk', 'Chesapeake', 'Garland',
+    'Irving', 'Hialeah', 'Fremont', 'Boise', 'Richmond', 'Baton Rouge', 'Spokane',
+]
+
+# Departures cluster around the morning and evening peaks
+HOUR_WEIGHTS = [0, 0, 0, 0, 1, 3, 8, 10, 9, 6, 5, 5, 5, 5, 5, 6, 8, 10, 9, 7, 5, 3, 2, 1]
+SEAT_WEIGHTS = [60, 25, 10, 5]  # parties of 1-4
+CANCELLATION_RATE = 0.08
+OPERATOR_CODES = {'FLIGHT': ['AA', 'DL', 'UA', 'WN', 'B6', 'AS'], 'TRAIN': ['AMT', 'MNR', 'CAL'],
+                  'BUS': ['GRY', 'MEG', 'FLX', 'PPB']}
+
+
+@contextmanager
+def explicit_booking_dates():
+    """Let bulk_create keep the generated booking_date instead of auto_now_add's now()"""
+    field = Booking._meta.get_field('booking_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Generate a large, reproducible dataset (travel options, users, bookings) with realistic '
+            'route popularity, departure times and booking lead times, in bounded-memory chunks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--options', type=int, default=1_000_000, help='Travel options to create')
+        parser.add_argument('--users', type=int, default=200_000, help='Users to create')
+        parser.add_argument('--bookings', type=int, default=500_000, help='Bookings to create (approximate)')
+        parser.add_argument('--cities', type=int, default=200, help='Distinct cities')
+        parser.add_argument('--days', type=int, default=90, help='Days of future departures')
+        parser.add_argument('--past-days', type=int, default=30, help='Days of past departures (for history)')
+        parser.add_argument('--start-date', help='Anchor date YYYY-MM-DD (default today); fix it to reproduce a dataset exactly')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create and per transaction')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help='First delete rows generated earlier with this seed')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'GEN{options["seed"]}-'
+        if options['start_date']:
+            anchor = datetime.strptime(options['start_date'], '%Y-%m-%d')
+        else:
+            anchor = datetime.combine(timezone.localdate(), datetime.min.time())
+        self.anchor = timezone.make_aware(anchor)
+        # Bookings are never made after the anchor, keeping the output independent of the clock
+        self.now = self.anchor
+
+        if options['clear']:
+            self.clear()
+        elif TravelOption.objects.filter(travel_id__startswith=self.prefix).exists():
+            raise CommandError(f'Rows from seed {options["seed"]} already exist; use --clear or another --seed')
+
+        self.build_cities(options['cities'])
+        user_ids = self.create_users(options['users'])
+        self.create_options_and_bookings(options, user_ids)
+
+        self.stdout.write('Rebuilding fare calendar...')
+        fare_calendar.rebuild()
+        self.stdout.write(self.style.SUCCESS('Dataset complete'))
+
+    # --- reference data -------------------------------------------------
+
+    def build_cities(self, count):
+        names = [
+            CITY_NAMES[i] if i < len(CITY_NAMES) else f'{CITY_NAMES[i % len(CITY_NAMES)]} {i // len(CITY_NAMES) + 1}'
+            for i in range(count)
+        ]
+        # Zipf-like popularity: a few hubs carry most of the traffic
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(count)]
+        self.cities = names
+        self.city_cum_weights = list(itertools.accumulate(weights))
+        self.coords = [(self.rng.uniform(0, 4000), self.rng.uniform(0, 2500)) for _ in names]
+        self.hour_cum_weights = list(itertools.accumulate(HOUR_WEIGHTS))
+
+    def pick_city(self):
+        return bisect.bisect(self.city_cum_weights, self.rng.random() * self.city_cum_weights[-1])
+
+    # --- users ----------------------------------------------------------
+
+    def create_users(self, count):
+        password = make_password('travel-pass')  # hashed once, shared by all generated users
+        started = time.perf_counter()
+        user_ids = []
+        for chunk_start in range(0, count, self.batch_size):
+            chunk = []
+            for n in range(chunk_start, min(chunk_start + self.batch_size, count)):
+                username = f'{self.prefix.lower()}user{n:07d}'
+                chunk.append(User(
+                    username=username, email=f'{username}@example.com', password=password,
+                    first_name=f'Traveller{n}',
+                    date_joined=self.anchor - timedelta(days=self.rng.uniform(0, 730)),
+                ))
+            with transaction.atomic():
+                User.objects.bulk_create(chunk, batch_size=self.batch_size)
+            user_ids.extend(self.saved_pks(User, chunk, 'username'))
+            self.progress('users', len(user_ids), count, started)
+        return user_ids
+
+    def saved_pks(self, model, objs, key):
+        """Primary keys of freshly bulk-created rows (MySQL doesn't return them)"""
+        if all(obj.pk is not None for obj in objs):
+            return [obj.pk for obj in objs]
+        by_key = dict(model.objects.filter(**{f'{key}__in': [getattr(o, key) for o in objs]}).values_list(key, 'pk'))
+        for obj in objs:
+            obj.pk = by_key[getattr(obj, key)]
+        return [obj.pk for obj in objs]
+
+    # --- travel options and bookings --------------------------------------
+
+    def make_option(self, n):
+        rng = self.rng
+        source = self.pick_city()
+        destination = self.pick_city()
+        while destination == source:
+            destination = self.pick_city()
+        (x1, y1), (x2, y2) = self.coords[source], self.coords[destination]
+        distance = max(math.hypot(x2 - x1, y2 - y1), 30)
+
+        if distance < 300:
+            ttype = 'BUS' if rng.random() < 0.6 else 'TRAIN'
+        elif distance < 800:
+            ttype = rng.choices(['TRAIN', 'BUS', 'FLIGHT'], [50, 20, 30])[0]
+        else:
+            ttype = 'FLIGHT' if rng.random() < 0.8 else 'TRAIN'
+
+        if ttype == 'FLIGHT':
+            hours, price, capacity = 0.75 + distance / 700, 60 + 0.12 * distance, rng.choice([150, 180, 220])
+        elif ttype == 'TRAIN':
+            hours, price, capacity = distance / 120, 15 + 0.08 * distance, rng.randint(300, 600)
+        else:
+            hours, price, capacity = distance / 70, 8 + 0.05 * distance, rng.randint(40, 60)
+
+        hour = bisect.bisect(self.hour_cum_weights, rng.random() * self.hour_cum_weights[-1])
+        departure = self.anchor + timedelta(
+            days=rng.randrange(-self.past_days, self.days), hours=hour, minutes=5 * rng.randrange(12)
+        )
+        travel_id = f'{self.prefix}{rng.choice(OPERATOR_CODES[ttype])}{n:08d}'
+        arrival = departure + timedelta(hours=hours * rng.uniform(0.95, 1.15))
+        fare = Decimal(price * rng.uniform(0.8, 1.4)).quantize(Decimal('0.01'))
+        option = TravelOption(
+            travel_id=travel_id,
+            type=ttype,
+            source=self.cities[source],
+            destination=self.cities[destination],
+            departure_datetime=departure,
+            arrival_datetime=arrival,
+            price=fare,
+            base_price=fare,
+            available_seats=capacity,
+            capacity=capacity,
+        )
+        # Busier routes sell more seats
+        option._demand = 1 / ((source + 1) * (destination + 1)) ** 0.5
+        return option
+
+    def make_bookings(self, chunk, count, user_ids):
+        rng = self.rng
+        demand = list(itertools.accumulate(o._demand for o in chunk))
+        bookings = []
+        for _ in range(count):
+            option = chunk[bisect.bisect(demand, rng.random() * demand[-1])]
+            seats = rng.choices((1, 2, 3, 4), SEAT_WEIGHTS)[0]
+            if seats > option.available_seats:
+                continue
+            # Frequent travellers: low user indexes book far more often
+            user_id = user_ids[int(len(user_ids) * rng.random() ** 2)]
+            lead = timedelta(days=min(rng.expovariate(1 / 14), 180))
+            booked = min(option.departure_datetime - lead, self.now - timedelta(minutes=rng.randrange(1, 10080)))
+            total = option.price * seats
+            booking = Booking(
+                booking_id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                user_id=user_id, travel_option=option, number_of_seats=seats,
+                total_price=total, unit_price=option.price, booking_date=booked,
+            )
+            if rng.random() < CANCELLATION_RATE:
+                cancelled = booked + (min(option.departure_datetime, self.now) - booked) * rng.random()
+                booking.status = 'CANCELLED'
+                booking.cancelled_at = cancelled
+                booking.cancellation_reason = 'User requested cancellation'
+                booking.refund_amount = (total * Decimal('0.9')).quantize(Decimal('0.01'))
+            else:
+                option.available_seats -= seats
+            bookings.append(booking)
+        return bookings
+
+    def create_options_and_bookings(self, options, user_ids):
+        self.days, self.past_days = options['days'], options['past_days']
+        total, wanted_bookings = options['options'], options['bookings'] if user_ids else 0
+        started = time.perf_counter()
+        created = booked = 0
+        with explicit_booking_dates():
+            for chunk_start in range(0, total, self.batch_size):
+                chunk = [self.make_option(n) for n in range(chunk_start, min(chunk_start + self.batch_size, total))]
+                # Spread bookings evenly over chunks so totals don't depend on the batch size
+                share = wanted_bookings * (chunk_start + len(chunk)) // total - wanted_bookings * chunk_start // total
+                bookings = self.make_bookings(chunk, share, user_ids)
+                with transaction.atomic():
+                    TravelOption.objects.bulk_create(chunk, batch_size=self.batch_size)
+                    self.saved_pks(TravelOption, chunk, 'travel_id')
+                    for booking in bookings:
+                        booking.travel_option_id = booking.travel_option.pk
+                    Booking.objects.bulk_create(bookings, batch_size=self.batch_size)
+                created += len(chunk)
+                booked += len(bookings)
+                self.progress('travel options', created, total, started, extra=f'{booked} bookings')
+
+    # --- helpers ------------------------------------------------------------
+
+    def delete_rows(self, cursor, model, where, params):
+        """
+        DELETE the rows of ``model`` matching ``where``, after the rows of every
+        table with a foreign key to them (bookings, profiles, rollups, archived
+        bookings...), so no constraint is left dangling.
+        """
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        for relation in model._meta.get_fields(include_hidden=True):
+            if relation.auto_created and not relation.concrete and (relation.one_to_many or relation.one_to_one):
+                target = qn(relation.field.target_field.column)
+                self.delete_rows(
+                    cursor, relation.related_model,
+                    f'{qn(relation.field.column)} IN (SELECT {target} FROM {table} WHERE {where})', params,
+                )
+        cursor.execute(f'DELETE FROM {table} WHERE {where}', params)
+
+    def progress(self, label, done, total, started, extra=''):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        eta = (total - done) / rate if rate else 0
+        self.stdout.write(
+            f'  {label}: {done:,}/{total:,} ({rate:,.0f} rows/s, ETA {eta:.0f}s){", " + extra if extra else ""}',
+        )
+
+    def clear(self):
+        """Delete earlier output of this seed in SQL; the ORM would load every row to send signals"""
+        qn = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.delete_rows(cursor, TravelOption, f'{qn("travel_id")} LIKE %s', [f'{self.prefix}%'])
+            self.delete_rows(cursor, User, f'{qn("username")} LIKE %s', [f'{self.prefix.lower()}user%'])
+        self.stdout.write(f'Cleared rows generated with prefix {self.prefix}')
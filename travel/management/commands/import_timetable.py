@@ -0,0 +1,222 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from travel.models import TravelOption
+from travel.utils import fare_calendar, price_history
+import csv
+import hashlib
+import os
+import time
+
+REQUIRED_COLUMNS = ('travel_id', 'type', 'source', 'destination', 'departure_datetime', 'price', 'available_seats')
+COLUMNS = REQUIRED_COLUMNS + ('arrival_datetime',)
+TYPES = {code for code, _ in TravelOption.TYPE_CHOICES}
+
+# Written on every upsert. The seat counts only apply to new departures: on
+# existing ones available_seats already reflects bookings, so they are kept
+# unless asked. The operator's price becomes the dynamic pricing base fare.
+UPDATE_FIELDS = ['type', 'source', 'destination', 'departure_datetime', 'arrival_datetime', 'price',
+                 'base_price', 'content_hash', 'updated_at']
+SEAT_FIELDS = ['available_seats', 'capacity']
+
+
+def row_hash(values):
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).hexdigest()
+
+
+def parse_datetime(value):
+    parsed = datetime.fromisoformat(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def parse_row(values, content_hash):
+    """TravelOption from one row's cells (in COLUMNS order); raises ValueError if invalid"""
+    travel_id, ttype, source, destination, departure, price, seats, arrival = values
+    for name, value in zip(REQUIRED_COLUMNS, values):
+        if not value:
+            raise ValueError(f'{name} is empty')
+    if len(travel_id) > 50:
+        raise ValueError('travel_id is longer than 50 characters')
+    ttype = ttype.upper()
+    if ttype not in TYPES:
+        raise ValueError(f'unknown type "{ttype}"')
+    try:
+        departure = parse_datetime(departure)
+        arrival = parse_datetime(arrival) if arrival else None
+    except ValueError:
+        raise ValueError('dates must be ISO 8601')
+    if arrival is not None and arrival < departure:
+        raise ValueError('arrives before it departs')
+    try:
+        price = Decimal(price)
+    except InvalidOperation:
+        raise ValueError(f'price "{price}" is not a number')
+    if price < 0 or price >= 10 ** 8:
+        raise ValueError(f'price {price} is out of range')
+    price = price.quantize(Decimal('0.01'))
+    if not seats.isdigit():
+        raise ValueError(f'available_seats "{seats}" is not a whole number')
+    return TravelOption(
+        travel_id=travel_id, type=ttype, source=source, destination=destination,
+        departure_datetime=departure, arrival_datetime=arrival, price=price, base_price=price,
+        available_seats=int(seats), capacity=int(seats), content_hash=content_hash,
+    )
+
+
+def read_range(path, start, end):
+    """Decoded lines of ``path`` from byte ``start`` (a line start) up to ``end``"""
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        position = start
+        while position < end:
+            line = fh.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8-sig')
+
+
+def split_ranges(path, jobs):
+    """Split the data after the header line into ``jobs`` byte ranges that start on line boundaries"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fh:
+        header = fh.readline()
+        first = len(header)
+        bounds = [first]
+        for i in range(1, jobs):
+            fh.seek(max(first + (size - first) * i // jobs, bounds[-1]))
+            fh.readline()  # finish the line the cut falls into
+            bounds.append(min(fh.tell(), size))
+    bounds.append(size)
+    return header.decode('utf-8-sig'), [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def upsert(options, overwrite_seats):
+    fields = UPDATE_FIELDS + (SEAT_FIELDS if overwrite_seats else [])
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    unique_fields = ['travel_id'] if connection.features.supports_update_conflicts_with_target else None
+    TravelOption.objects.bulk_create(
+        options, batch_size=len(options), update_conflicts=True,
+        unique_fields=unique_fields, update_fields=fields,
+    )
+
+
+def import_range(path, header, start, end, chunk_size, overwrite_seats, max_errors):
+    """Import one byte range of the file; returns counters and the first errors"""
+    positions = {name.strip(): i for i, name in enumerate(next(csv.reader([header])))}
+    stats = {'rows': 0, 'invalid': 0, 'unchanged': 0, 'inserted': 0, 'updated': 0, 'errors': []}
+
+    def flush(chunk):
+        # Only rows whose digest differs from the stored one are parsed and written
+        existing = {
+            travel_id: (content_hash, pk, price)
+            for travel_id, content_hash, pk, price in TravelOption.objects.filter(
+                travel_id__in=list(chunk)
+            ).values_list('travel_id', 'content_hash', 'pk', 'price')
+        }
+        changed = []
+        for travel_id, (cells, content_hash) in chunk.items():
+            if travel_id in existing and existing[travel_id][0] == content_hash:
+                stats['unchanged'] += 1
+                continue
+            try:
+                changed.append(parse_row(cells, content_hash))
+            except ValueError as exc:
+                stats['invalid'] += 1
+                if len(stats['errors']) < max_errors:
+                    stats['errors'].append(f'{travel_id}: {exc}')
+        if changed:
+            with transaction.atomic():
+                upsert(changed, overwrite_seats)
+                # Existing departures whose fare moved
+                price_history.record([
+                    (existing[o.travel_id][1], o.source, o.destination, existing[o.travel_id][2], o.price)
+                    for o in changed if o.travel_id in existing and existing[o.travel_id][2] != o.price
+                ])
+            updated = sum(1 for option in changed if option.travel_id in existing)
+            stats['updated'] += updated
+            stats['inserted'] += len(changed) - updated
+
+    chunk = {}
+    for values in csv.reader(read_range(path, start, end)):
+        if not any(values):
+            continue
+        stats['rows'] += 1
+        cells = [values[positions[name]].strip() if positions.get(name, len(values)) < len(values) else ''
+                 for name in COLUMNS]
+        if not cells[0]:
+            stats['invalid'] += 1
+            if len(stats['errors']) < max_errors:
+                stats['errors'].append('(no travel_id): travel_id is empty')
+            continue
+        chunk[cells[0]] = (cells, row_hash(cells))  # a later row for the same travel_id wins
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = {}
+    if chunk:
+        flush(chunk)
+    return stats
+
+
+class Command(BaseCommand):
+    help = ('Stream a timetable CSV into TravelOption, upserting on travel_id in chunks over parallel '
+            'workers; rows whose content hash is unchanged are skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row: ' + ', '.join(COLUMNS) + ' (arrival optional)')
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Parallel worker processes')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per upsert and transaction')
+        parser.add_argument('--overwrite-seats', action='store_true',
+                            help='Also overwrite available_seats of departures that already exist')
+        parser.add_argument('--max-errors', type=int, default=20, help='Invalid rows to print')
+        parser.add_argument('--no-calendar', action='store_true', help='Skip the fare calendar rebuild')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        jobs = max(options['jobs'], 1)
+        if connection.vendor == 'sqlite' and ':memory:' in str(connection.settings_dict['NAME']):
+            jobs = 1  # other processes cannot see an in-memory database
+        # Several ranges per worker balance the load and give regular progress lines
+        header, ranges = split_ranges(path, jobs * 4)
+        columns = {name.strip() for name in next(csv.reader([header]), [])}
+        missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+        if missing:
+            raise CommandError(f'Missing columns: {", ".join(missing)}')
+
+        args = (options['chunk_size'], options['overwrite_seats'], options['max_errors'])
+        totals = {'rows': 0, 'invalid': 0, 'unchanged': 0, 'inserted': 0, 'updated': 0, 'errors': []}
+        started = time.perf_counter()
+        if jobs > 1:
+            connections.close_all()  # each worker process opens its own connection
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(import_range, path, header, start, end, *args) for start, end in ranges]
+                for future in as_completed(futures):
+                    self.add(totals, future.result(), started)
+        else:
+            for start, end in ranges:
+                self.add(totals, import_range(path, header, start, end, *args), started)
+        elapsed = time.perf_counter() - started
+
+        for error in totals['errors'][:options['max_errors']]:
+            self.stderr.write(f'  invalid row {error}')
+        self.stdout.write(
+            f'{totals["rows"]:,} rows in {elapsed:.2f}s ({totals["rows"] / elapsed if elapsed else 0:,.0f} rows/s): '
+            f'{totals["inserted"]:,} inserted, {totals["updated"]:,} updated, '
+            f'{totals["unchanged"]:,} unchanged, {totals["invalid"]:,} invalid'
+        )
+        if (totals['inserted'] or totals['updated']) and not options['no_calendar']:
+            # bulk_create sends no signals, so the calendar is recomputed in one pass
+            fare_calendar.rebuild()
+        self.stdout.write(self.style.SUCCESS('Import complete'))
+
+    def add(self, totals, stats, started):
+        for key in ('rows', 'invalid', 'unchanged', 'inserted', 'updated'):
+            totals[key] += stats[key]
+        totals['errors'] += stats['errors']
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'  {totals["rows"]:,} rows ({totals["rows"] / elapsed if elapsed else 0:,.0f} rows/s)')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from travel.utils import fare_calendar, schedules
+
+
+class Command(BaseCommand):
+    help = ('Materialize the departures of active recurring schedules up to the horizon, so the first '
+            'search of the day does not pay for it (e.g. run daily from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Days ahead to cover (default SCHEDULE_HORIZON_DAYS)')
+
+    def handle(self, *args, **options):
+        schedules.forget_coverage()
+        created = schedules.ensure_materialized(schedules.window_end(days=options['days']), sync=False)
+        if created:
+            # One grouped pass instead of a refresh per touched bucket
+            fare_calendar.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{created} departures materialized'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from travel.utils import fare_calendar
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed low-fare calendar from the current travel options'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Number of days to precompute (defaults to FARE_CALENDAR_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        count = fare_calendar.rebuild(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Fare calendar rebuilt: {count} route-days'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from travel.utils import fare_calendar
+from travel.utils.pricing import reprice
+import numpy as np
+
+
+class Command(BaseCommand):
+    help = ('Reprice every upcoming departure from its load factor, time to departure and route demand '
+            '(rules in settings.PRICING_RULES)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per UPDATE ... CASE statement and transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing')
+        parser.add_argument('--no-calendar', action='store_true', help='Skip the fare calendar rebuild')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        result = reprice(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        timings = result['timings']
+        total = sum(timings.values())
+
+        self.stdout.write(
+            f'{result["departures"]:,} departures in {total:.2f}s '
+            f'(load {timings["load"]:.2f}s, compute {timings["compute"]:.3f}s, write {timings["write"]:.2f}s)'
+        )
+        if result['departures']:
+            low, median, high = np.percentile(result['multiplier'], [0, 50, 100])
+            self.stdout.write(f'  multipliers: min {low:.2f}, median {median:.2f}, max {high:.2f}')
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(f'  {result["changed"]:,} prices {verb}')
+
+        if result['changed'] and not options['dry_run'] and not options['no_calendar']:
+            # The raw UPDATE sends no signals, so the calendar is recomputed in one pass
+            fare_calendar.rebuild()
+        self.stdout.write(self.style.SUCCESS('Repricing complete'))
@@ -0,0 +1,257 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from travel.models import TravelOption, Booking
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+OUTCOMES = ('booked', 'cancelled', 'rejected', 'lock_timeouts', 'deadlocks', 'errors')
+
+
+def classify_error(message):
+    message = message.lower()
+    if 'deadlock' in message:
+        return 'deadlocks'
+    if 'locked' in message or 'lock wait timeout' in message:
+        return 'lock_timeouts'
+    return 'errors'
+
+
+def percentile(values, fraction):
+    return values[max(int(len(values) * fraction + 0.5) - 1, 0)] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent book_travel and cancel_booking requests at a few hot departures, '
+            'report throughput, tail latency, lock waits and deadlocks, and check that every '
+            'departure still has available_seats + booked seats == capacity')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departures', type=int, default=3, help='Hot departures everyone competes for')
+        parser.add_argument('--seats', type=int, default=200, help='Capacity of each hot departure')
+        parser.add_argument('--workers', type=int, default=16, help='Client threads per process, one user each')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes (sidesteps the GIL)')
+        parser.add_argument('--operations', type=int, default=2000, help='Total book/cancel requests')
+        parser.add_argument('--cancel-ratio', type=float, default=0.3,
+                            help='Share of operations that cancel one of the worker\'s own bookings')
+        parser.add_argument('--max-seats', type=int, default=3, help='Largest party size booked')
+        parser.add_argument('--lock-wait-ms', type=float, default=5.0,
+                            help='A lock-taking statement (BEGIN IMMEDIATE, SELECT ... FOR UPDATE) '
+                                 'slower than this counts as a lock wait')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--worker-spec', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker_spec']:
+            # Child process: run the client threads and hand the raw results back as JSON
+            self.stdout.write(json.dumps(self.run_workers(json.loads(options['worker_spec']), options)))
+            return
+        if connection.vendor == 'sqlite' and ':memory:' in str(connection.settings_dict['NAME']):
+            raise CommandError('Run against a file database; in-memory SQLite cannot be shared across threads')
+
+        tag = f'STRESS-{int(time.time() * 1000)}'
+        departure = timezone.now() + timedelta(days=30)
+        travels = [
+            TravelOption.objects.create(
+                travel_id=f'{tag}-{i}', type='FLIGHT', source='Stress Hub', destination=f'Hot Spot {i}',
+                departure_datetime=departure + timedelta(hours=i), price=50, available_seats=options['seats'],
+            )
+            for i in range(options['departures'])
+        ]
+        users = [
+            User.objects.create_user(username=f'{tag.lower()}-{i}')
+            for i in range(options['workers'] * options['processes'])
+        ]
+        specs = [
+            {
+                'travels': [t.pk for t in travels],
+                'users': [u.pk for u in users[p * options['workers']:(p + 1) * options['workers']]],
+                'operations': options['operations'] // options['processes']
+                + (p < options['operations'] % options['processes']),
+                'seed': options['seed'] + p * 1000,
+            }
+            for p in range(options['processes'])
+        ]
+
+        try:
+            started = time.perf_counter()
+            if options['processes'] == 1:
+                parts = [self.run_workers(specs[0], options)]
+            else:
+                parts = self.run_processes(specs, options)
+            elapsed = time.perf_counter() - started
+
+            remaining = {t.pk: t.available_seats for t in TravelOption.objects.filter(pk__in=[t.pk for t in travels])}
+            booked = dict(
+                Booking.objects.filter(travel_option__in=travels, status='CONFIRMED')
+                .values_list('travel_option').annotate(seats=Sum('number_of_seats'))
+            )
+        finally:
+            Booking.objects.filter(travel_option__in=travels).delete()
+            TravelOption.objects.filter(pk__in=[t.pk for t in travels]).delete()
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        self.report(parts, elapsed, options)
+        self.check_conservation(parts, travels, remaining, booked, options)
+
+    # --- running the load -------------------------------------------------
+
+    def run_processes(self, specs, options):
+        forwarded = []
+        for name in ('max_seats', 'cancel_ratio', 'lock_wait_ms'):
+            forwarded += [f'--{name.replace("_", "-")}', str(options[name])]
+        children = [
+            subprocess.Popen(
+                [sys.executable, 'manage.py', 'stress_bookings', '--worker-spec', json.dumps(spec), *forwarded],
+                cwd=settings.BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for spec in specs
+        ]
+        parts = []
+        for child in children:
+            stdout, stderr = child.communicate()
+            if child.returncode != 0:
+                raise CommandError(f'Worker process failed:\n{stderr[-2000:]}')
+            parts.append(json.loads(stdout.strip().splitlines()[-1]))
+        return parts
+
+    def run_workers(self, spec, options):
+        travels = spec['travels']
+        threads = len(spec['users'])
+        outcomes = dict.fromkeys(OUTCOMES, 0)
+        result = {'outcomes': outcomes, 'latency': {'book': [], 'cancel': []}, 'lock_waits': [],
+                  'seats_booked': 0, 'seats_cancelled': 0}
+        lock = threading.Lock()
+        book_urls = [reverse('travel:book', args=[pk]) for pk in travels]
+        my_bookings = reverse('travel:my_bookings')
+
+        def lock_timer(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                waited = (time.perf_counter() - started) * 1000
+                if waited > options['lock_wait_ms'] and (sql.startswith('BEGIN') or 'FOR UPDATE' in sql):
+                    with lock:
+                        result['lock_waits'].append(waited)
+
+        def worker(index):
+            rng = random.Random(spec['seed'] + index)
+            user_id = spec['users'][index]
+            client = Client()
+            client.force_login(User.objects.get(pk=user_id))
+            mine = []  # (booking pk, seats) of this worker's confirmed bookings
+            count = spec['operations'] // threads + (index < spec['operations'] % threads)
+            try:
+                with connection.execute_wrapper(lock_timer):
+                    for _ in range(count):
+                        cancel = mine and rng.random() < options['cancel_ratio']
+                        if cancel:
+                            booking_pk, seats = mine.pop(rng.randrange(len(mine)))
+                            url, data = reverse('travel:cancel_booking', args=[booking_pk]), {}
+                        else:
+                            seats = rng.randint(1, options['max_seats'])
+                            url, data = rng.choice(book_urls), {'number_of_seats': seats}
+                        started = time.perf_counter()
+                        try:
+                            response = client.post(url, data)
+                            if response.status_code == 302 and response['Location'] == my_bookings:
+                                outcome = 'cancelled' if cancel else 'booked'
+                            elif response.status_code in (200, 302):
+                                content = response.content.decode(errors='replace')
+                                outcome = classify_error(content) if 'failed' in content.lower() else 'rejected'
+                            else:
+                                outcome = 'errors'
+                        except Exception as exc:
+                            outcome = classify_error(str(exc))
+                            self.stderr.write(f'Worker {index}: {exc}')
+                        elapsed = (time.perf_counter() - started) * 1000
+
+                        if outcome == 'booked':
+                            mine.append(
+                                Booking.objects.filter(user_id=user_id, status='CONFIRMED')
+                                .order_by('-pk').values_list('pk', 'number_of_seats').first()
+                            )
+                        elif cancel and outcome != 'cancelled':
+                            mine.append((booking_pk, seats))  # still confirmed; may be retried
+                        with lock:
+                            outcomes[outcome] += 1
+                            result['latency']['cancel' if cancel else 'book'].append(elapsed)
+                            if outcome == 'booked':
+                                result['seats_booked'] += seats
+                            elif outcome == 'cancelled':
+                                result['seats_cancelled'] += seats
+            finally:
+                connections.close_all()
+
+        settings_override = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'QUERY_INSPECTOR_ENABLED': False,
+        }
+        with override_settings(**settings_override):
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(worker, range(threads)))
+        return result
+
+    # --- results ------------------------------------------------------------
+
+    def report(self, parts, elapsed, options):
+        outcomes = {key: sum(part['outcomes'][key] for part in parts) for key in OUTCOMES}
+        operations = sum(outcomes.values())
+        self.stdout.write(
+            f'Operations:     {operations} from {options["workers"] * options["processes"]} clients '
+            f'({options["processes"]} process(es)) on {options["departures"]} departures in {elapsed:.2f}s '
+            f'({operations / elapsed:.1f} ops/s)'
+        )
+        self.stdout.write('Outcomes:       ' + ', '.join(f'{key} {outcomes[key]}' for key in OUTCOMES))
+        for kind in ('book', 'cancel'):
+            timings = sorted(t for part in parts for t in part['latency'][kind])
+            if timings:
+                self.stdout.write(
+                    f'{kind + " latency:":<16}p50 {statistics.median(timings):7.1f} ms  '
+                    f'p95 {percentile(timings, 0.95):7.1f} ms  p99 {percentile(timings, 0.99):7.1f} ms  '
+                    f'max {timings[-1]:7.1f} ms'
+                )
+        waits = sorted(w for part in parts for w in part['lock_waits'])
+        self.stdout.write(
+            f'Lock waits:     {len(waits)} over {options["lock_wait_ms"]} ms'
+            + (f', total {sum(waits) / 1000:.2f}s, p95 {percentile(waits, 0.95):.1f} ms, '
+               f'max {waits[-1]:.1f} ms' if waits else '')
+        )
+        self.stdout.write(f'Deadlocks:      {outcomes["deadlocks"]}  lock timeouts: {outcomes["lock_timeouts"]}')
+        self.outcomes = outcomes
+
+    def check_conservation(self, parts, travels, remaining, booked, options):
+        problems = []
+        for travel in travels:
+            seats = booked.get(travel.pk, 0)
+            left = remaining[travel.pk]
+            self.stdout.write(f'  {travel.travel_id}: {seats} booked + {left} left of {options["seats"]}')
+            if seats + left != options['seats']:
+                problems.append(f'{travel.travel_id} is off by {seats + left - options["seats"]} seats')
+
+        # What the clients saw succeed must match what the database kept
+        observed = sum(part['seats_booked'] - part['seats_cancelled'] for part in parts)
+        if observed != sum(booked.values()):
+            problems.append(f'clients saw {observed} seats sold, database has {sum(booked.values())}')
+        failures = self.outcomes['lock_timeouts'] + self.outcomes['deadlocks'] + self.outcomes['errors']
+        if failures:
+            problems.append(f'{failures} requests failed on locks or errors')
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Seats conserved on every departure; no deadlocks or lock errors'))
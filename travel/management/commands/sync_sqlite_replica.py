@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import sqlite3
+import time
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over the replica file (SQLITE_REPLICA_PATH), '
+            'standing in for replication when trying read-replica routing locally')
+
+    def handle(self, *args, **options):
+        if 'replica' not in connections.settings:
+            raise CommandError('No "replica" database configured; set SQLITE_REPLICA_PATH')
+        primary, replica = connections['default'].settings_dict, connections['replica'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != primary['ENGINE']:
+            raise CommandError('Only SQLite primary and replica files can be synced this way')
+
+        connections['replica'].close()
+        started = time.perf_counter()
+        source = sqlite3.connect(primary['NAME'])
+        target = sqlite3.connect(replica['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Replica {replica["NAME"]} synced in {(time.perf_counter() - started) * 1000:.0f} ms'
+        ))
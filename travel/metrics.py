@@ -0,0 +1,204 @@
+"""
+Request metrics with Prometheus text exposition.
+
+Each process keeps its own histograms in memory. When METRICS_DIR is set,
+every process also writes a snapshot of them to ``METRICS_DIR/<pid>.json``
+(at most once per METRICS_FLUSH_SECONDS), and the /metrics view merges all
+snapshots, so one scrape covers every gunicorn worker. Clear METRICS_DIR
+when the server starts, as with prometheus_client's multiprocess mode.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+from .utils.timing import step_timed
+
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'travel_request_duration_seconds': ('Wall time per request', 'view', TIME_BUCKETS),
+    'travel_request_db_seconds': ('Database time per request', 'view', TIME_BUCKETS),
+    'travel_request_queries': ('Queries per request', 'view', COUNT_BUCKETS),
+    'travel_request_template_seconds': ('Template render time per request', 'view', TIME_BUCKETS),
+    'travel_template_render_seconds': ('Render time per top-level template', 'template', TIME_BUCKETS),
+    'travel_step_duration_seconds': ('Duration of timed steps (email, PDF)', 'step', TIME_BUCKETS),
+    # Counters have no buckets
+    'travel_db_connections_opened_total': ('Database connections opened', 'alias', None),
+}
+
+# Per-request accumulator for template render time
+current_request = ContextVar('travel_metrics_request', default=None)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._dirty = False
+        self._flushed_at = 0.0
+
+    def observe(self, metric, label, value):
+        buckets = METRICS[metric][2]
+        with self._lock:
+            series = self._data.setdefault(metric, {}).setdefault(
+                label, {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            )
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+            self._dirty = True
+        self.maybe_flush()
+
+    def inc(self, metric, label, amount=1):
+        with self._lock:
+            series = self._data.setdefault(metric, {}).setdefault(label, {'value': 0})
+            series['value'] += amount
+            self._dirty = True
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._data))
+
+    def _path(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        return os.path.join(directory, f'{os.getpid()}.json') if directory else None
+
+    def maybe_flush(self, force=False):
+        path = self._path()
+        if not path or not self._dirty:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < getattr(settings, 'METRICS_FLUSH_SECONDS', 1.0):
+            return
+        self._flushed_at = now
+        self._dirty = False
+        data = self.snapshot()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Merge this process's live data with every other process's snapshot"""
+        self.maybe_flush(force=True)
+        merged = {}
+        sources = [self.snapshot()]
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and os.path.isdir(directory):
+            own = self._path()
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if not name.endswith('.json') or path == own:
+                    continue
+                try:
+                    with open(path) as fh:
+                        sources.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue
+        for source in sources:
+            for metric, series in source.items():
+                if metric not in METRICS:
+                    continue
+                for label, values in series.items():
+                    if 'value' in values:
+                        target = merged.setdefault(metric, {}).setdefault(label, {'value': 0})
+                        target['value'] += values['value']
+                        continue
+                    target = merged.setdefault(metric, {}).setdefault(
+                        label, {'buckets': [0] * len(values['buckets']), 'sum': 0.0, 'count': 0}
+                    )
+                    target['buckets'] = [a + b for a, b in zip(target['buckets'], values['buckets'])]
+                    target['sum'] += values['sum']
+                    target['count'] += values['count']
+        return merged
+
+
+registry = Registry()
+atexit.register(lambda: registry.maybe_flush(force=True))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(data=None):
+    data = registry.collect() if data is None else data
+    lines = []
+    for metric, (help_text, label_name, buckets) in METRICS.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {"histogram" if buckets else "counter"}')
+        for label, series in sorted(data.get(metric, {}).items()):
+            label_text = f'{label_name}="{_escape(label)}"'
+            if not buckets:
+                lines.append(f'{metric}{{{label_text}}} {series["value"]}')
+                continue
+            for bound, count in zip(buckets, series['buckets']):
+                lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+            lines.append(f'{metric}_sum{{{label_text}}} {series["sum"]:.6f}')
+            lines.append(f'{metric}_count{{{label_text}}} {series["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _step_timed(sender, step, duration, **kwargs):
+    if metrics_enabled():
+        registry.observe('travel_step_duration_seconds', step, duration)
+
+
+step_timed.connect(_step_timed, dispatch_uid='travel.metrics.step_timed')
+
+
+def _connection_created(sender, connection, **kwargs):
+    # Compared with the request count this gives the connection reuse rate
+    if metrics_enabled():
+        registry.inc('travel_db_connections_opened_total', connection.alias)
+
+
+connection_created.connect(_connection_created, dispatch_uid='travel.metrics.connection_created')
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = current_request.get()
+            if stats is not None:
+                stats['template'] += elapsed
+            if metrics_enabled():
+                registry.observe('travel_template_render_seconds', self.template.name or '<string>', elapsed)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The standard Django template backend, timing every top-level render"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,255 @@
+"""
+Request instrumentation middleware for the travel app.
+
+Every class here runs in the mode of the handler chain around it, sync
+under WSGI and async under ASGI, so an ASGI request and its async view stay
+on the event loop instead of being handed to a thread.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .db_router import PIN_COOKIE, pin_seconds, replica_read_views, routing
+from .metrics import current_request, metrics_enabled, registry
+from .utils.profiling import aprofile_request, build_report, profile_request, profiled_view, save_report
+from .utils.query_tracking import QueryRecorder, query_budget
+from .utils.slow_queries import current_view
+
+
+logger = logging.getLogger('travel.queries')
+
+
+def _url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base class: process() handles a request under WSGI, aprocess() under
+    ASGI, picked by whether the next handler in the chain is a coroutine.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.aprocess(request)
+        return self.process(request)
+
+    def process(self, request):
+        raise NotImplementedError
+
+    async def aprocess(self, request):
+        raise NotImplementedError
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise with an async path. WhiteNoiseMiddleware is sync-only, and
+    near the top of the chain it would put every ASGI request below it on a
+    thread; here only static files are opened on one.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if not iscoroutinefunction(self):
+            return super().__call__(request)
+        return self.aprocess(request)
+
+    async def aprocess(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class QueryInspectorMiddleware(SyncAndAsyncMiddleware):
+    """
+    Count the queries each request runs, flag repeated SQL shapes (N+1) and
+    requests over their QUERY_BUDGETS entry. Results go to the
+    ``travel.queries`` logger and the X-Query-Count response header.
+    Enabled with QUERY_INSPECTOR_ENABLED (defaults to DEBUG).
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG)
+
+    def process(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def aprocess(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        url_name = _url_name(request)
+        response['X-Query-Count'] = str(recorder.count)
+
+        for shape, count in recorder.duplicates():
+            logger.warning('Possible N+1 in %s: %d x %s', url_name or request.path, count, shape)
+
+        budget = query_budget(url_name)
+        if budget is not None and recorder.count > budget:
+            logger.warning('%s ran %d queries (budget %d)', url_name, recorder.count, budget)
+        return response
+
+
+class MetricsMiddleware(SyncAndAsyncMiddleware):
+    """
+    Record wall time, database time, query count and template render time
+    for every request, labelled by URL name. Exposed on /metrics.
+    """
+
+    def process(self, request):
+        if not metrics_enabled():
+            return self.get_response(request)
+
+        stats = {'template': 0.0}
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            with QueryRecorder() as recorder:
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.observe(request, response, time.perf_counter() - started, recorder, stats)
+
+    async def aprocess(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+
+        stats = {'template': 0.0}
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            with QueryRecorder() as recorder:
+                response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.observe(request, response, time.perf_counter() - started, recorder, stats)
+
+    def observe(self, request, response, elapsed, recorder, stats):
+        view = _url_name(request) or 'unmatched'
+        registry.observe('travel_request_duration_seconds', view, elapsed)
+        registry.observe('travel_request_db_seconds', view, recorder.total_time)
+        registry.observe('travel_request_queries', view, recorder.count)
+        registry.observe('travel_request_template_seconds', view, stats['template'])
+        return response
+
+
+class SlowQueryLogMiddleware(SyncAndAsyncMiddleware):
+    """Label slow-query log entries with the URL name of the view that ran them"""
+
+    def process(self, request):
+        token = current_view.set(request.path)
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    async def aprocess(self, request):
+        token = current_view.set(request.path)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_view.set(_url_name(request) or request.path)
+
+
+class ProfilerMiddleware(SyncAndAsyncMiddleware):
+    """
+    Profile a request when a superuser adds ``?_profile=1`` and return the
+    report instead of the page (see travel/utils/profiling.py). Removed from
+    the middleware chain entirely unless PROFILER_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process(self, request):
+        if '_profile' not in request.GET or not request.user.is_superuser:
+            return self.get_response(request)
+        return self.report(request, *profile_request(self.get_response, request))
+
+    async def aprocess(self, request):
+        if '_profile' not in request.GET or not (await request.auser()).is_superuser:
+            return await self.get_response(request)
+        return self.report(request, *await aprofile_request(self.get_response, request))
+
+    def report(self, request, response, profiles, recorder, elapsed):
+        report = build_report(request, response, profiles, recorder, elapsed)
+        saved = save_report(request, profiles, report)
+        if saved:
+            report = f'Saved to {saved}.prof / .txt\n\n{report}'
+        return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Views that run on another thread than the request's profile get their own
+        return profiled_view(request, view_func, view_args, view_kwargs)
+
+
+class ReplicaRoutingMiddleware(SyncAndAsyncMiddleware):
+    """
+    Send the reads of REPLICA_READ_VIEWS to the read replica, and pin a
+    client to the primary for REPLICA_PIN_SECONDS after it writes
+    (see travel/db_router.py).
+    """
+
+    def process(self, request):
+        with routing() as state:
+            request._db_routing = state
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def aprocess(self, request):
+        with routing() as state:
+            request._db_routing = state
+            response = await self.get_response(request)
+        return self.pin(response, state)
+
+    def pin(self, response, state):
+        if state['wrote']:
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = getattr(request, '_db_routing', None)
+        if (
+            state is not None
+            and request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+            and _url_name(request) in replica_read_views()
+        ):
+            state['replica'] = True
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0007_farecalendarday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['departure_datetime'], name='travel_opt_departure_idx'),
+        ),
+    ]
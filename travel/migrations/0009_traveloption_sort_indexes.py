@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0008_traveloption_departure_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['price', 'departure_datetime'], name='travel_opt_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['-available_seats', 'departure_datetime'], name='travel_opt_seats_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['type', 'departure_datetime'], name='travel_opt_type_dep_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['type', 'price', 'departure_datetime'], name='travel_opt_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['type', '-available_seats', 'departure_datetime'], name='travel_opt_type_seats_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0010_booking_user_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
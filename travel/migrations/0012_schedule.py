@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0011_traveloption_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='Departures get travel_id CODE-YYYYMMDD', max_length=40, unique=True)),
+                ('type', models.CharField(choices=[('FLIGHT', 'Flight'), ('TRAIN', 'Train'), ('BUS', 'Bus')], max_length=10)),
+                ('source', models.CharField(max_length=120)),
+                ('destination', models.CharField(max_length=120)),
+                ('departure_time', models.TimeField()),
+                ('duration', models.DurationField()),
+                ('weekdays', models.CharField(default='1234567', max_length=7)),
+                ('valid_from', models.DateField()),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('capacity', models.PositiveIntegerField()),
+                ('active', models.BooleanField(default=True)),
+                ('materialized_until', models.DateField(blank=True, editable=False, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['active', 'materialized_until'], name='travel_sched_pending_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departures', to='travel.schedule'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    """Existing departures start from their current fare and sold-plus-free seats"""
+    TravelOption = apps.get_model('travel', 'TravelOption')
+    Booking = apps.get_model('travel', 'Booking')
+    ArchivedBooking = apps.get_model('travel', 'ArchivedBooking')
+    sold = Booking.objects.filter(travel_option=OuterRef('pk'), status='CONFIRMED').order_by().values(
+        'travel_option'
+    ).annotate(seats=Sum('number_of_seats')).values('seats')
+    TravelOption.objects.update(
+        base_price=F('price'), capacity=F('available_seats') + Coalesce(Subquery(sold), 0)
+    )
+    # Per-seat fares are computed in Python, as Booking.save() does: SQLite
+    # stores whole-number decimals as integers and would divide them as such.
+    # Rows are read up front, so no cursor is open on the table it updates.
+    for model in (Booking, ArchivedBooking):
+        rows = list(model.objects.filter(number_of_seats__gt=0).values_list('pk', 'total_price', 'number_of_seats'))
+        model.objects.bulk_update(
+            [model(pk=pk, unit_price=(Decimal(total) / seats).quantize(Decimal('0.01'))) for pk, total, seats in rows],
+            ['unit_price'], batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0013_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtraveloption',
+            name='base_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtraveloption',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='base_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
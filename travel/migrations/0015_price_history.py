@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0014_dynamic_pricing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_option_id', models.BigIntegerField()),
+                ('source', models.CharField(max_length=120)),
+                ('destination', models.CharField(max_length=120)),
+                ('recorded_at', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['travel_option_id', 'recorded_at'], name='travel_pricehist_opt_idx'), models.Index(fields=['source', 'destination', 'recorded_at', 'price'], name='travel_pricehist_route_idx')],
+            },
+        ),
+    ]
@@ -1,10 +1,8 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 import uuid
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 
 User = get_user_model()
 
@@ -19,9 +17,41 @@ class TravelOption(models.Model):
     source = models.CharField(max_length=120)
     destination = models.CharField(max_length=120)
     departure_datetime = models.DateTimeField()
+    arrival_datetime = models.DateTimeField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     available_seats = models.PositiveIntegerField(default=0)
+    # Dynamic pricing inputs (see utils/pricing.py): the seats the departure
+    # went on sale with and the fare the engine scales; unset means
+    # available_seats and price
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Digest of the timetable row this option was last imported from (import_timetable)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    # Set on departures materialized from a recurring Schedule
+    schedule = models.ForeignKey(
+        'Schedule', null=True, blank=True, on_delete=models.SET_NULL, related_name='departures'
+    )
+
+    class Meta:
+        # One index per supported travel_list sort order, with and without a
+        # leading type column (see utils/search.py)
+        indexes = [
+            models.Index(fields=['departure_datetime'], name='travel_opt_departure_idx'),
+            models.Index(fields=['price', 'departure_datetime'], name='travel_opt_price_idx'),
+            models.Index(fields=['-available_seats', 'departure_datetime'], name='travel_opt_seats_idx'),
+            models.Index(fields=['type', 'departure_datetime'], name='travel_opt_type_dep_idx'),
+            models.Index(fields=['type', 'price', 'departure_datetime'], name='travel_opt_type_price_idx'),
+            models.Index(fields=['type', '-available_seats', 'departure_datetime'], name='travel_opt_type_seats_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can see what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def __str__(self):
         return f"{self.travel_id} • {self.type} • {self.source}->{self.destination}"
@@ -30,6 +60,99 @@ class TravelOption(models.Model):
         return reverse("travel:detail", args=[self.pk])
 
 
+class Schedule(models.Model):
+    """
+    A recurring service. Its departures become TravelOption rows only when a
+    search or booking first needs them (see utils/schedules.py), so the
+    TravelOption table holds a rolling window instead of a year of rows.
+    """
+    code = models.CharField(max_length=40, unique=True, help_text='Departures get travel_id CODE-YYYYMMDD')
+    type = models.CharField(max_length=10, choices=TravelOption.TYPE_CHOICES)
+    source = models.CharField(max_length=120)
+    destination = models.CharField(max_length=120)
+    departure_time = models.TimeField()
+    duration = models.DurationField()
+    # ISO weekdays the service runs on, e.g. "12345" for Monday to Friday
+    weekdays = models.CharField(max_length=7, default='1234567')
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    capacity = models.PositiveIntegerField()
+    active = models.BooleanField(default=True)
+    # Departures exist for every date before this one
+    materialized_until = models.DateField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active', 'materialized_until'], name='travel_sched_pending_idx'),
+        ]
+
+    def clean(self):
+        if not self.weekdays or any(c not in '1234567' for c in self.weekdays):
+            raise ValidationError({'weekdays': 'Use ISO weekday digits 1 (Monday) to 7 (Sunday).'})
+        if self.valid_until and self.valid_until < self.valid_from:
+            raise ValidationError({'valid_until': 'Must not be before valid_from.'})
+
+    def runs_on(self, day):
+        return (
+            str(day.isoweekday()) in self.weekdays
+            and day >= self.valid_from
+            and (self.valid_until is None or day <= self.valid_until)
+        )
+
+    def __str__(self):
+        return f"{self.code} • {self.type} • {self.source}->{self.destination} {self.departure_time:%H:%M}"
+
+
+class FareCalendarDay(models.Model):
+    """Cheapest fare and remaining seats per route, travel type and day"""
+    source = models.CharField(max_length=120)
+    destination = models.CharField(max_length=120)
+    type = models.CharField(max_length=10, choices=TravelOption.TYPE_CHOICES)
+    day = models.DateField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    available_seats = models.PositiveIntegerField(default=0)
+    departures = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'destination', 'type', 'day'],
+                name='travel_farecal_route_day_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.source}->{self.destination} {self.type} {self.day}: {self.min_price}"
+
+
+class PriceHistory(models.Model):
+    """
+    Append-only log of departure prices (see utils/price_history.py).
+    travel_option_id is a plain column rather than a foreign key so the
+    history outlives archiving, which keeps the departure's id.
+    """
+    travel_option_id = models.BigIntegerField()
+    # Copied from the departure so route queries read this table alone
+    source = models.CharField(max_length=120)
+    destination = models.CharField(max_length=120)
+    recorded_at = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # One departure's series
+            models.Index(fields=['travel_option_id', 'recorded_at'], name='travel_pricehist_opt_idx'),
+            # Daily minimum per route; price is included so the index covers the query
+            models.Index(fields=['source', 'destination', 'recorded_at', 'price'], name='travel_pricehist_route_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.travel_option_id} {self.recorded_at:%Y-%m-%d %H:%M}: {self.price}"
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ("CONFIRMED", "Confirmed"),
@@ -40,12 +163,20 @@ class Booking(models.Model):
     travel_option = models.ForeignKey(TravelOption, on_delete=models.CASCADE)
     number_of_seats = models.PositiveIntegerField()
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    # Fare per seat when sold; prices move afterwards (see utils/pricing.py)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="CONFIRMED")
     cancelled_at = models.DateTimeField(null=True, blank=True)
     cancellation_reason = models.TextField(blank=True, default="")
     refund_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Booking history keyset pagination on (booking_date, id) per user
+            models.Index(fields=['user', 'booking_date'], name='travel_book_user_date_idx'),
+        ]
+
     def __str__(self):
         return f"Booking {self.booking_id} by {self.user}"
     
@@ -80,22 +211,133 @@ class Booking(models.Model):
 
     def clean(self):
         """
-        Ensure valid seat count. Only check availability if travel_option is attached.
+        Ensure valid seat count. Only check availability if travel_option is attached
+        and the booking is new: its seats are already taken once it exists, so a
+        sold-out departure must not block cancelling it.
         """
         if self.number_of_seats is None:
             return
         if self.number_of_seats < 1:
             raise ValidationError({"number_of_seats": "Number of seats must be at least 1."})
-        if getattr(self, "travel_option_id", None):
+        if self._state.adding and getattr(self, "travel_option_id", None):
             if self.number_of_seats > self.travel_option.available_seats:
                 raise ValidationError({
                     "number_of_seats": f"Only {self.travel_option.available_seats} seats available."
                 })
 
     def save(self, *args, **kwargs):
+        if self.unit_price is None and self.number_of_seats and self.total_price is not None:
+            from decimal import Decimal
+            self.unit_price = (Decimal(self.total_price) / self.number_of_seats).quantize(Decimal('0.01'))
         self.full_clean()
         super().save(*args, **kwargs)
 
+    is_archived = False
+
+
+# Archive tables (see utils/archive.py). Departed trips and their bookings are
+# moved here with their primary keys, so URLs and PDFs keep working, and the
+# live tables and their indexes only hold what is still bookable or recent.
+
+class ArchivedTravelOption(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    travel_id = models.CharField(max_length=50, db_index=True)
+    type = models.CharField(max_length=10, choices=TravelOption.TYPE_CHOICES)
+    source = models.CharField(max_length=120)
+    destination = models.CharField(max_length=120)
+    departure_datetime = models.DateTimeField(db_index=True)
+    arrival_datetime = models.DateTimeField(null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    available_seats = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.travel_id} • {self.type} • {self.source}->{self.destination} (archived)"
+
+
+class ArchivedBooking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking_id = models.UUIDField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    travel_option = models.ForeignKey(ArchivedTravelOption, on_delete=models.CASCADE, related_name='bookings')
+    number_of_seats = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    booking_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    cancellation_reason = models.TextField(blank=True, default="")
+    refund_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'booking_date'], name='travel_arch_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking {self.booking_id} by {self.user} (archived)"
+
+    def can_cancel(self):
+        return False
+
+
+class BookingRollup(models.Model):
+    """Totals of archived bookings per booking day, route, travel type and status"""
+    day = models.DateField()
+    type = models.CharField(max_length=10, choices=TravelOption.TYPE_CHOICES)
+    source = models.CharField(max_length=120)
+    destination = models.CharField(max_length=120)
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    bookings = models.PositiveIntegerField(default=0)
+    seats = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'type', 'source', 'destination', 'status'],
+                name='travel_rollup_bucket_uniq',
+            ),
+        ]
+
+
+class UserBookingRollup(models.Model):
+    """Totals of a user's archived bookings"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='booking_rollup')
+    bookings = models.PositiveIntegerField(default=0)
+    confirmed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+
+class UserProfileManager(models.Manager):
+    def for_user(self, user):
+        """
+        Return the user's profile, creating it on first read. Profiles are not
+        created or touched when the User row is saved, so logins (which save
+        last_login) cost no extra write.
+        """
+        try:
+            return user.profile
+        except UserProfile.DoesNotExist:
+            pass
+        # The lookup above already missed, so go straight to the insert
+        try:
+            with transaction.atomic():
+                profile = self.create(user=user)
+        except IntegrityError:
+            profile = self.get(user=user)
+        user.profile = profile
+        return profile
+
 
 class UserProfile(models.Model):
     """Extended user profile with additional information"""
@@ -134,6 +376,8 @@ class UserProfile(models.Model):
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserProfileManager()
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -153,11 +397,3 @@ class UserProfile(models.Model):
     class Meta:
         verbose_name = 'User Profile'
         verbose_name_plural = 'User Profiles'
-
-
-# Signal to automatically create/update user profile
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Create profile when user is created"""
-    if created:
-        UserProfile.objects.create(user=instance)
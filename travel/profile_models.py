@@ -1,79 +0,0 @@
-from django.db import models
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-
-
-class UserProfile(models.Model):
-    """Extended user profile with additional information"""
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    
-    # Personal Information
-    phone_number = models.CharField(max_length=15, blank=True)
-    date_of_birth = models.DateField(null=True, blank=True)
-    gender = models.CharField(max_length=10, choices=[
-        ('M', 'Male'),
-        ('F', 'Female'),
-        ('O', 'Other'),
-        ('N', 'Prefer not to say')
-    ], blank=True)
-    
-    # Address Information
-    address_line1 = models.CharField(max_length=255, blank=True)
-    address_line2 = models.CharField(max_length=255, blank=True)
-    city = models.CharField(max_length=100, blank=True)
-    state = models.CharField(max_length=100, blank=True)
-    country = models.CharField(max_length=100, blank=True, default='USA')
-    postal_code = models.CharField(max_length=20, blank=True)
-    
-    # Travel Preferences
-    preferred_travel_type = models.CharField(max_length=10, choices=[
-        ('FLIGHT', 'Flight'),
-        ('TRAIN', 'Train'),
-        ('BUS', 'Bus'),
-        ('ANY', 'No Preference')
-    ], default='ANY', blank=True)
-    
-    # Identification
-    passport_number = models.CharField(max_length=20, blank=True)
-    id_number = models.CharField(max_length=50, blank=True, help_text="Driver's License or National ID")
-    
-    # Profile Settings
-    profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
-    bio = models.TextField(max_length=500, blank=True)
-    newsletter_subscription = models.BooleanField(default=True)
-    sms_notifications = models.BooleanField(default=False)
-    
-    # Metadata
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    
-    def __str__(self):
-        return f"{self.user.username}'s Profile"
-    
-    def get_full_address(self):
-        """Return formatted full address"""
-        parts = [
-            self.address_line1,
-            self.address_line2,
-            self.city,
-            self.state,
-            self.postal_code,
-            self.country
-        ]
-        return ', '.join(filter(None, parts))
-    
-    class Meta:
-        verbose_name = 'User Profile'
-        verbose_name_plural = 'User Profiles'
-
-
-# Signal to automatically create/update user profile
-@receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    """Create profile when user is created, update when user is saved"""
-    if created:
-        UserProfile.objects.create(user=instance)
-    else:
-        if hasattr(instance, 'profile'):
-            instance.profile.save()
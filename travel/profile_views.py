@@ -2,36 +2,43 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Count, Sum, Q, Avg
+from django.db.models import Count, Sum, Q, Avg, Max
+from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 from .models import UserProfile
 from .profile_forms import UserProfileForm, ChangePasswordForm
 from .models import Booking, TravelOption
+from .utils.booking_history import get_booking_page
 
 
 @login_required
 def user_profile(request):
     """Display user profile"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = UserProfile.objects.for_user(request.user)
     
-    # Get user statistics
-    total_bookings = Booking.objects.filter(user=request.user).count()
-    confirmed_bookings = Booking.objects.filter(user=request.user, status='CONFIRMED').count()
-    cancelled_bookings = Booking.objects.filter(user=request.user, status='CANCELLED').count()
-    total_spent = Booking.objects.filter(user=request.user, status='CONFIRMED').aggregate(
-        total=Sum('total_price')
-    )['total'] or 0
+    # Get user statistics in a single aggregate query: live bookings plus the
+    # rollup of archived ones (one row per user, so the join adds no rows)
+    stats = User.objects.filter(pk=request.user.pk).aggregate(
+        total_bookings=Count('booking'),
+        confirmed_bookings=Count('booking', filter=Q(booking__status='CONFIRMED')),
+        cancelled_bookings=Count('booking', filter=Q(booking__status='CANCELLED')),
+        total_spent=Sum('booking__total_price', filter=Q(booking__status='CONFIRMED')),
+        archived_bookings=Max('booking_rollup__bookings'),
+        archived_confirmed=Max('booking_rollup__confirmed'),
+        archived_cancelled=Max('booking_rollup__cancelled'),
+        archived_spent=Max('booking_rollup__spent'),
+    )
     
-    # Recent bookings
-    recent_bookings = Booking.objects.filter(user=request.user).order_by('-booking_date')[:5]
+    # Recent bookings, live or archived
+    recent_bookings = get_booking_page(request.user, size=5)
     
     context = {
         'profile': profile,
-        'total_bookings': total_bookings,
-        'confirmed_bookings': confirmed_bookings,
-        'cancelled_bookings': cancelled_bookings,
-        'total_spent': total_spent,
+        'total_bookings': stats['total_bookings'] + (stats['archived_bookings'] or 0),
+        'confirmed_bookings': stats['confirmed_bookings'] + (stats['archived_confirmed'] or 0),
+        'cancelled_bookings': stats['cancelled_bookings'] + (stats['archived_cancelled'] or 0),
+        'total_spent': (stats['total_spent'] or 0) + (stats['archived_spent'] or 0),
         'recent_bookings': recent_bookings,
     }
     return render(request, 'travel/profile/profile.html', context)
@@ -40,7 +47,7 @@ def user_profile(request):
 @login_required
 def edit_profile(request):
     """Edit user profile"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = UserProfile.objects.for_user(request.user)
     
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=profile)
@@ -72,27 +79,20 @@ def change_password(request):
 
 @login_required
 def booking_history(request):
-    """View complete booking history with filters"""
-    bookings = Booking.objects.filter(user=request.user).order_by('-booking_date')
-    
-    # Filters
-    status_filter = request.GET.get('status')
-    travel_type = request.GET.get('travel_type')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    if status_filter:
-        bookings = bookings.filter(status=status_filter)
-    if travel_type:
-        bookings = bookings.filter(travel_option__type=travel_type)
-    if date_from:
-        bookings = bookings.filter(booking_date__gte=date_from)
-    if date_to:
-        bookings = bookings.filter(booking_date__lte=date_to)
+    """View complete booking history with filters, newest first, keyset-paginated"""
+    filters = {
+        'status': request.GET.get('status'),
+        'travel_type': request.GET.get('travel_type'),
+        'date_from': request.GET.get('date_from'),
+        'date_to': request.GET.get('date_to'),
+    }
+    bookings = get_booking_page(request.user, filters=filters, cursor=request.GET.get('after'))
     
     context = {
         'bookings': bookings,
-        'status_filter': status_filter,
-        'travel_type': travel_type,
+        'status_filter': filters['status'],
+        'travel_type': filters['travel_type'],
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
     }
     return render(request, 'travel/profile/booking_history.html', context)
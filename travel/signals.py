@@ -0,0 +1,99 @@
+"""
+Signal handlers that keep the in-process search structures, the
+precomputed tables, cached booking history and live seat feeds in step
+with TravelOption and Booking changes. Handlers run after commit so a
+rolled-back booking never leaks into them. The price history is the
+exception: it is written in the saving transaction, like the price itself.
+"""
+import time
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import TravelOption, Booking, Schedule
+from .utils import fare_calendar, price_history
+from .utils.booking_history import invalidate_user_history
+from .utils.autocomplete import cities
+from .utils.connections import planner
+from .utils.seat_feed import publish_seats
+from .utils.schedules import forget_coverage
+
+
+def _fare_buckets(instance):
+    """Calendar buckets the option is in now and was in when loaded"""
+    buckets = {fare_calendar.bucket_for(
+        instance.source, instance.destination, instance.type, instance.departure_datetime
+    )}
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(f in loaded for f in ('source', 'destination', 'type', 'departure_datetime')):
+        buckets.add(fare_calendar.bucket_for(
+            loaded['source'], loaded['destination'], loaded['type'], loaded['departure_datetime']
+        ))
+    return buckets
+
+
+def _route_changed(instance, created):
+    loaded = getattr(instance, '_loaded_values', {})
+    return created or any(
+        f in loaded and loaded[f] != getattr(instance, f) for f in ('source', 'destination')
+    )
+
+
+def _seats_changed(instance, created):
+    loaded = getattr(instance, '_loaded_values', {})
+    return created or loaded.get('available_seats') != instance.available_seats
+
+
+def _price_changed(instance, created, price):
+    loaded = getattr(instance, '_loaded_values', {})
+    return not created and 'price' in loaded and loaded['price'] != price
+
+
+def _refresh_fare_buckets(buckets):
+    for bucket in buckets:
+        fare_calendar.refresh_bucket(*bucket)
+
+
+@receiver(post_save, sender=TravelOption)
+def travel_option_saved(sender, instance, created, **kwargs):
+    price = instance._meta.get_field('price').to_python(instance.price)
+    if _price_changed(instance, created, price):
+        old = instance._loaded_values['price']
+        price_history.record([(instance.pk, instance.source, instance.destination, old, price)])
+    # The saved price is the baseline for the next save, also of a new instance
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), 'price': price}
+    buckets = _fare_buckets(instance)
+    transaction.on_commit(lambda: planner.update_option(instance))
+    transaction.on_commit(lambda: _refresh_fare_buckets(buckets))
+    # Bookings and cancellations: push the new count to live watchers
+    if _seats_changed(instance, created):
+        pk, seats = instance.pk, instance.available_seats
+        transaction.on_commit(lambda: publish_seats(pk, seats))
+    # Seat and price changes don't affect the city index
+    if _route_changed(instance, created):
+        changed_at = time.monotonic()
+        transaction.on_commit(lambda: cities.invalidate(changed_at))
+
+
+@receiver(post_delete, sender=TravelOption)
+def travel_option_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    buckets = _fare_buckets(instance)
+    transaction.on_commit(lambda: planner.remove_option(pk))
+    transaction.on_commit(lambda: _refresh_fare_buckets(buckets))
+    changed_at = time.monotonic()
+    transaction.on_commit(lambda: cities.invalidate(changed_at))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_history(user_id))
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def schedule_changed(sender, instance, **kwargs):
+    transaction.on_commit(forget_coverage)
@@ -0,0 +1,34 @@
+"""
+Test helpers shared by the travel test suite.
+"""
+from contextlib import contextmanager
+
+from .utils.query_tracking import QueryRecorder, query_budget
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin asserting that a block stays within a query budget and
+    runs no repeated query shape (N+1).
+
+        with self.assertQueryBudget('travel:my_bookings'):
+            self.client.get(reverse('travel:my_bookings'))
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, url_name=None, budget=None, allow_duplicates=False):
+        if budget is None:
+            budget = query_budget(url_name)
+            if budget is None:
+                self.fail(f'No QUERY_BUDGETS entry for {url_name}')
+        with QueryRecorder() as recorder:
+            yield recorder
+        label = url_name or 'block'
+        if recorder.count > budget:
+            queries = '\n'.join(q['sql'] for q in recorder.queries)
+            self.fail(f'{label} ran {recorder.count} queries, budget is {budget}:\n{queries}')
+        if not allow_duplicates:
+            duplicates = recorder.duplicates()
+            if duplicates:
+                shapes = '\n'.join(f'{n} x {shape}' for shape, n in duplicates)
+                self.fail(f'{label} repeats queries (N+1):\n{shapes}')
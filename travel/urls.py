@@ -1,7 +1,7 @@
 from django.urls import path
 from . import views
 from .profile_views import user_profile, edit_profile, change_password, booking_history
-from .admin_views import admin_dashboard, admin_bookings, admin_users, admin_travel_options
+from .admin_views import admin_dashboard, admin_bookings, admin_users, admin_travel_options, admin_slow_queries
 from django.contrib.auth import views as auth_views
 
 app_name = 'travel'
@@ -9,8 +9,14 @@ app_name = 'travel'
 urlpatterns = [
     path('', views.index, name='index'),
     path('travel/', views.travel_list, name='list'),
+    path('travel/connections/', views.connection_search, name='connections'),
+    path('travel/fare-calendar/', views.fare_calendar_view, name='fare_calendar'),
+    path('travel/autocomplete/', views.city_autocomplete, name='autocomplete'),
+    path('travel/price-history/', views.route_price_history, name='route_price_history'),
     path('travel/<int:pk>/', views.travel_detail, name='detail'),
+    path('travel/<int:pk>/price-history/', views.travel_price_history, name='price_history'),
     path('travel/<int:pk>/book/', views.book_travel, name='book'),
+    path('travel/<int:pk>/seats/', views.seat_stream, name='seat_stream'),
     path('bookings/', views.my_bookings, name='my_bookings'),
     path('booking/<int:pk>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('booking/<int:pk>/download-ticket/', views.download_ticket, name='download_ticket'),
@@ -26,9 +32,13 @@ urlpatterns = [
     path('profile/change-password/', change_password, name='change_password'),
     path('profile/booking-history/', booking_history, name='booking_history'),
     
+    # Prometheus metrics (superuser or METRICS_TOKEN)
+    path('metrics', views.metrics, name='metrics'),
+    
     # Admin Dashboard URLs (using 'dashboard/' to avoid conflict with Django admin)
     path('dashboard/', admin_dashboard, name='admin_dashboard'),
     path('dashboard/bookings/', admin_bookings, name='admin_bookings'),
     path('dashboard/users/', admin_users, name='admin_users'),
     path('dashboard/travel-options/', admin_travel_options, name='admin_travel_options'),
+    path('dashboard/slow-queries/', admin_slow_queries, name='admin_slow_queries'),
 ]
@@ -0,0 +1,150 @@
+"""
+Archiving of departed trips.
+
+archive_chunk() moves a batch of departures that left before a cutoff, with
+all their bookings, from TravelOption/Booking into ArchivedTravelOption/
+ArchivedBooking. Rows keep their primary keys, so booking URLs and PDF
+downloads keep working. Each batch is one transaction, so an interrupted run
+loses nothing and the next run carries on where it stopped.
+
+Archived bookings are also added to BookingRollup (per booking day, route,
+type and status) and UserBookingRollup (per user). All-time statistics read
+the small rollup tables instead of scanning the archive. The dashboard's
+day/week/month figures only need live rows, because ARCHIVE_MIN_DAYS keeps
+every booking from the last 30 days live.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import (
+    ArchivedBooking, ArchivedTravelOption, Booking, BookingRollup, TravelOption, UserBookingRollup,
+)
+from .booking_history import invalidate_user_history
+
+
+# The dashboard's windowed figures reach back 30 days
+ARCHIVE_MIN_DAYS = 31
+
+OPTION_FIELDS = ['id', 'travel_id', 'type', 'source', 'destination', 'departure_datetime',
+                 'arrival_datetime', 'price', 'available_seats', 'capacity', 'base_price', 'created_at',
+                 'updated_at']
+BOOKING_FIELDS = ['id', 'booking_id', 'user_id', 'travel_option_id', 'number_of_seats', 'total_price',
+                  'unit_price', 'booking_date', 'status', 'cancelled_at', 'cancellation_reason', 'refund_amount']
+
+
+def _copy(model, obj, fields):
+    return model(**{field: getattr(obj, field) for field in fields})
+
+
+def _delete(model, pks):
+    # Plain DELETE: the ORM would load every row and fire the per-row signals,
+    # which only refresh search structures past departures are not part of
+    if not pks:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(pks))})', pks)
+
+
+def _accumulate(model, key_fields, totals, existing):
+    """Add ``totals`` ({key tuple: {field: delta}}) onto the rollup rows in ``existing``"""
+    rows = {tuple(getattr(row, f) for f in key_fields): row for row in existing.select_for_update()}
+    new, changed = [], []
+    for key, deltas in totals.items():
+        row = rows.get(key)
+        if row is None:
+            new.append(model(**dict(zip(key_fields, key)), **deltas))
+            continue
+        for field, delta in deltas.items():
+            setattr(row, field, getattr(row, field) + delta)
+        changed.append(row)
+    model.objects.bulk_create(new)
+    if changed:
+        model.objects.bulk_update(changed, list(next(iter(totals.values()))))
+
+
+def _add_rollups(bookings, options):
+    zero = {'bookings': 0, 'seats': 0, 'revenue': Decimal('0'), 'refunds': Decimal('0')}
+    buckets = defaultdict(lambda: dict(zero))
+    users = defaultdict(lambda: {'bookings': 0, 'confirmed': 0, 'cancelled': 0, 'spent': Decimal('0')})
+    for booking in bookings:
+        option = options[booking.travel_option_id]
+        bucket = buckets[(timezone.localdate(booking.booking_date), option.type, option.source,
+                          option.destination, booking.status)]
+        bucket['bookings'] += 1
+        bucket['seats'] += booking.number_of_seats
+        bucket['revenue'] += booking.total_price
+        bucket['refunds'] += booking.refund_amount or 0
+        user = users[(booking.user_id,)]
+        user['bookings'] += 1
+        if booking.status == 'CONFIRMED':
+            user['confirmed'] += 1
+            user['spent'] += booking.total_price
+        elif booking.status == 'CANCELLED':
+            user['cancelled'] += 1
+    if buckets:
+        days = {key[0] for key in buckets}
+        _accumulate(BookingRollup, ('day', 'type', 'source', 'destination', 'status'), buckets,
+                    BookingRollup.objects.filter(day__in=days, source__in={key[2] for key in buckets}))
+        _accumulate(UserBookingRollup, ('user_id',), users,
+                    UserBookingRollup.objects.filter(user_id__in=[key[0] for key in users]))
+
+
+def archive_chunk(before, size):
+    """
+    Move up to ``size`` departures that left before ``before``, and their
+    bookings, into the archive. Returns (departures, bookings) moved.
+    """
+    with transaction.atomic():
+        ids = list(
+            TravelOption.objects.select_for_update().filter(departure_datetime__lt=before)
+            .order_by('pk').values_list('pk', flat=True)[:size]
+        )
+        if not ids:
+            return 0, 0
+        options = {option.pk: option for option in TravelOption.objects.filter(pk__in=ids)}
+        bookings = list(Booking.objects.filter(travel_option_id__in=ids))
+
+        ArchivedTravelOption.objects.bulk_create(
+            [_copy(ArchivedTravelOption, option, OPTION_FIELDS) for option in options.values()]
+        )
+        ArchivedBooking.objects.bulk_create([_copy(ArchivedBooking, b, BOOKING_FIELDS) for b in bookings])
+        _add_rollups(bookings, options)
+        _delete(Booking, [b.pk for b in bookings])
+        _delete(TravelOption, ids)
+
+        user_ids = {b.user_id for b in bookings}
+        transaction.on_commit(lambda: [invalidate_user_history(user_id) for user_id in user_ids])
+    return len(ids), len(bookings)
+
+
+def find_booking(user, pk):
+    """The user's booking with this pk, live or archived, or None"""
+    return (
+        Booking.objects.filter(pk=pk, user=user).select_related('travel_option', 'user').first()
+        or ArchivedBooking.objects.filter(pk=pk, user=user).select_related('travel_option', 'user').first()
+    )
+
+
+def rollup_totals():
+    """All-time totals of archived bookings by status"""
+    return {
+        row['status']: row
+        for row in BookingRollup.objects.values('status').annotate(
+            bookings=Sum('bookings'), revenue=Sum('revenue'), refunds=Sum('refunds')
+        ).order_by()
+    }
+
+
+def merged_counts(live, archived, limit=None):
+    """Add two {key: count} mappings and return (key, count) pairs, largest first"""
+    totals = defaultdict(int)
+    for counts in (live, archived):
+        for key, count in counts.items():
+            totals[key] += count or 0
+    ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit] if limit else ranked
@@ -0,0 +1,145 @@
+"""
+In-process prefix index for the source and destination search boxes.
+
+Every city and station name is stored once, keyed by its normalised form and
+by the start of each later word ("new york" and "york"), in one sorted list.
+A prefix is a bisect into that list, and results are memoised per prefix
+until the next rebuild, so lookups never touch the database.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    """Immutable prefix index over {name: departure_count}"""
+
+    def __init__(self, counts):
+        self.names = sorted(counts)
+        self.counts = [counts[name] for name in self.names]
+        entries = []
+        for position, name in enumerate(self.names):
+            words = normalize(name).split(' ')
+            for start in range(len(words)):
+                entries.append((' '.join(words[start:]), position))
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._positions = [position for _, position in entries]
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, prefix, limit=8):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        cache_key = (prefix, limit)
+        cached = self._memo.get(cache_key)
+        if cached is not None:
+            return cached
+
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + '\uffff', start)
+        positions = set(self._positions[start:end])
+        best = heapq.nlargest(limit, positions, key=lambda p: (self.counts[p], -p))
+        result = [(self.names[p], self.counts[p]) for p in best]
+
+        if len(self._memo) < 10000:
+            self._memo[cache_key] = result
+        return result
+
+
+class CityAutocomplete:
+    """
+    Process-wide index holder. Built when a server worker starts (see warm)
+    or else on first use, rebuilt after commits that add, remove or rename a
+    route, and refreshed in the background once it is older than
+    AUTOCOMPLETE_REFRESH_SECONDS so other workers' writes show up.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def build_counts(self):
+        from ..models import TravelOption
+        counts = {}
+        for field in ('source', 'destination'):
+            for row in TravelOption.objects.values(field).annotate(n=Count('id')).order_by():
+                name = row[field].strip()
+                if name:
+                    counts[name] = counts.get(name, 0) + row['n']
+        return counts
+
+    def rebuild(self):
+        index = PrefixIndex(self.build_counts())
+        with self._lock:
+            self._index = index
+            self._built_at = time.monotonic()
+            self._refreshing = False
+        return index
+
+    def warm(self):
+        """
+        Build the index before the first request. Called from the WSGI and
+        ASGI entry points only, so management commands and tests never pay
+        for it; a database that is not migrated yet leaves it to first use.
+        """
+        from django.db import DatabaseError
+        try:
+            self.rebuild()
+        except DatabaseError:
+            pass
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            from django.db import connection
+            try:
+                self.rebuild()
+            finally:
+                self._refreshing = False
+                connection.close()
+
+        threading.Thread(target=run, name='autocomplete-refresh', daemon=True).start()
+
+    def lookup(self, prefix, limit=8):
+        index = self._index
+        if index is None:
+            index = self.rebuild()
+        elif time.monotonic() - self._built_at > getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 300):
+            self._refresh_in_background()
+        return index.lookup(prefix, limit)
+
+    def invalidate(self, changed_at, wait=True):
+        """
+        Rebuild if the index is loaded in this process and predates the
+        change. A bulk delete queues one call per row; only the first one
+        does any work. With wait=False the rebuild runs in the background.
+        """
+        if self._index is not None and self._built_at < changed_at:
+            if wait:
+                self.rebuild()
+            else:
+                self._refresh_in_background()
+
+
+cities = CityAutocomplete()
@@ -0,0 +1,140 @@
+"""
+Keyset-paginated booking history.
+
+Bookings are listed newest first and paged on (booking_date, id): the next
+page is "everything strictly older than the last row shown", which stays an
+index range scan however deep the user pages. Archived bookings (see
+archive.py) are read the same way from their own table and merged in, so the
+history is complete across both. The first page of each user's history is
+cached and invalidated when one of their bookings changes or is archived.
+"""
+import base64
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from ..models import ArchivedBooking, Booking
+
+
+FILTER_PARAMS = ('status', 'travel_type', 'date_from', 'date_to')
+
+
+def page_size():
+    return getattr(settings, 'BOOKING_HISTORY_PAGE_SIZE', 20)
+
+
+def encode_cursor(booking):
+    raw = f'{booking.booking_date.isoformat()}|{booking.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (booking_date, pk) or None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        stamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(stamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class BookingPage:
+    def __init__(self, bookings, next_cursor, is_first):
+        self.object_list = bookings
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _filtered(model, user, filters):
+    bookings = model.objects.filter(user=user).select_related('travel_option')
+    if filters.get('status'):
+        bookings = bookings.filter(status=filters['status'])
+    if filters.get('travel_type'):
+        bookings = bookings.filter(travel_option__type=filters['travel_type'])
+    if filters.get('date_from'):
+        bookings = bookings.filter(booking_date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        bookings = bookings.filter(booking_date__lte=filters['date_to'])
+    return bookings.order_by('-booking_date', '-id')
+
+
+def _fetch(user, filters, position, size):
+    rows = []
+    for model in (Booking, ArchivedBooking):
+        bookings = _filtered(model, user, filters)
+        if position:
+            booking_date, pk = position
+            bookings = bookings.filter(
+                Q(booking_date__lt=booking_date) | Q(booking_date=booking_date, id__lt=pk)
+            )
+        rows += bookings[:size + 1]
+    # Primary keys are shared by both tables, so (booking_date, id) still orders them uniquely
+    rows.sort(key=lambda b: (b.booking_date, b.pk), reverse=True)
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+def _valid_date(value):
+    try:
+        return parse_date(value) is not None
+    except ValueError:
+        return False
+
+
+def _version_key(user_id):
+    return f'booking_history:version:{user_id}'
+
+
+def _first_page_key(user_id, filters, size):
+    version = cache.get(_version_key(user_id), 0)
+    digest = hashlib.md5(
+        '&'.join(f'{k}={filters.get(k) or ""}' for k in FILTER_PARAMS).encode()
+    ).hexdigest()
+    return f'booking_history:{user_id}:{version}:{size}:{digest}'
+
+
+def get_booking_page(user, filters=None, cursor=None, size=None):
+    """One page of a user's bookings; the first page is served from cache"""
+    filters = {k: v for k, v in (filters or {}).items() if k in FILTER_PARAMS and v}
+    for key in ('date_from', 'date_to'):
+        if key in filters and not _valid_date(filters[key]):
+            del filters[key]
+    size = size or page_size()
+    position = decode_cursor(cursor)
+    if position:
+        rows, next_cursor = _fetch(user, filters, position, size)
+        return BookingPage(rows, next_cursor, is_first=False)
+
+    key = _first_page_key(user.pk, filters, size)
+    cached = cache.get(key)
+    if cached is None:
+        cached = _fetch(user, filters, None, size)
+        cache.set(key, cached, getattr(settings, 'BOOKING_HISTORY_CACHE_SECONDS', 300))
+    rows, next_cursor = cached
+    return BookingPage(rows, next_cursor, is_first=True)
+
+
+def invalidate_user_history(user_id):
+    """Bumping the version orphans every cached first page for the user"""
+    key = _version_key(user_id)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
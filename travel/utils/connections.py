@@ -0,0 +1,373 @@
+"""
+Multi-leg connection planner over an in-memory, time-dependent route graph.
+
+The graph holds every bookable departure inside a rolling horizon, grouped by
+source station and sorted by departure time, so a search only ever walks the
+departures that leave a station after the traveller can be there. Stations
+are matched on their normalised name (case, accents and spacing ignored), the
+same form the city autocomplete uses.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .autocomplete import normalize
+
+
+# Used when a departure has no arrival time on record
+DEFAULT_LEG_DURATIONS = {
+    'FLIGHT': timedelta(hours=2),
+    'TRAIN': timedelta(hours=6),
+    'BUS': timedelta(hours=8),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+@lru_cache(maxsize=65536)
+def station_key(name):
+    """Graph key of a station name"""
+    return normalize(name)
+
+
+class Leg:
+    """One departure in the route graph"""
+    __slots__ = ('pk', 'travel_id', 'type', 'source', 'destination',
+                 'departs', 'arrives', 'price', 'seats', 'from_key', 'to_key')
+
+    def __init__(self, pk, travel_id, type, source, destination, departs, arrives, price, seats):
+        self.pk = pk
+        self.travel_id = travel_id
+        self.type = type
+        self.source = source
+        self.destination = destination
+        self.departs = departs
+        self.arrives = arrives
+        self.price = price
+        self.seats = seats
+        self.from_key = station_key(source)
+        self.to_key = station_key(destination)
+
+    @classmethod
+    def from_option(cls, option):
+        arrival = option.arrival_datetime
+        if arrival is None or arrival <= option.departure_datetime:
+            durations = _setting('CONNECTION_DEFAULT_DURATIONS', DEFAULT_LEG_DURATIONS)
+            arrival = option.departure_datetime + durations.get(option.type, timedelta(hours=4))
+        return cls(
+            pk=option.pk,
+            travel_id=option.travel_id,
+            type=option.type,
+            source=option.source,
+            destination=option.destination,
+            departs=option.departure_datetime.timestamp(),
+            arrives=arrival.timestamp(),
+            price=float(option.price),
+            seats=option.available_seats,
+        )
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'travel_id': self.travel_id,
+            'type': self.type,
+            'source': self.source,
+            'destination': self.destination,
+            'departure': datetime.fromtimestamp(self.departs, tz=dt_timezone.utc).isoformat(),
+            'arrival': datetime.fromtimestamp(self.arrives, tz=dt_timezone.utc).isoformat(),
+            'price': round(self.price, 2),
+        }
+
+
+class Itinerary:
+    """A chain of legs from the requested source to the requested destination"""
+
+    def __init__(self, legs):
+        self.legs = legs
+
+    @property
+    def departs(self):
+        return self.legs[0].departs
+
+    @property
+    def arrives(self):
+        return self.legs[-1].arrives
+
+    @property
+    def duration(self):
+        return self.arrives - self.departs
+
+    @property
+    def price(self):
+        return sum(leg.price for leg in self.legs)
+
+    def as_dict(self):
+        return {
+            'legs': [leg.as_dict() for leg in self.legs],
+            'transfers': len(self.legs) - 1,
+            'duration_minutes': int(self.duration // 60),
+            'total_price': round(self.price, 2),
+        }
+
+
+class SearchResult:
+    def __init__(self, fastest, cheapest, elapsed_ms, truncated):
+        self.fastest = fastest
+        self.cheapest = cheapest
+        self.elapsed_ms = elapsed_ms
+        self.truncated = truncated
+
+    def as_dict(self):
+        return {
+            'fastest': self.fastest.as_dict() if self.fastest else None,
+            'cheapest': self.cheapest.as_dict() if self.cheapest else None,
+            'elapsed_ms': round(self.elapsed_ms, 2),
+            'truncated': self.truncated,
+        }
+
+
+class ConnectionGraph:
+    """
+    Departures indexed by source station. Each station keeps two parallel
+    sorted lists (departure timestamps and legs) so the first departure after
+    a given time is a single bisect.
+    """
+
+    def __init__(self):
+        self._times = {}
+        self._legs = {}
+        self._by_pk = {}
+
+    def __len__(self):
+        return len(self._by_pk)
+
+    def add(self, leg):
+        self.remove(leg.pk)
+        times = self._times.setdefault(leg.from_key, [])
+        legs = self._legs.setdefault(leg.from_key, [])
+        index = bisect_left(times, leg.departs)
+        times.insert(index, leg.departs)
+        legs.insert(index, leg)
+        self._by_pk[leg.pk] = leg
+
+    def bulk_load(self, legs):
+        """Replace the graph contents; much faster than repeated add()"""
+        self._times, self._legs, self._by_pk = {}, {}, {}
+        for leg in legs:
+            self._by_pk[leg.pk] = leg
+            self._legs.setdefault(leg.from_key, []).append(leg)
+        for source, station_legs in self._legs.items():
+            station_legs.sort(key=lambda l: l.departs)
+            self._times[source] = [l.departs for l in station_legs]
+
+    def remove(self, pk):
+        leg = self._by_pk.pop(pk, None)
+        if leg is None:
+            return
+        times = self._times[leg.from_key]
+        legs = self._legs[leg.from_key]
+        index = bisect_left(times, leg.departs)
+        while legs[index].pk != pk:
+            index += 1
+        del times[index]
+        del legs[index]
+
+    def prune(self, before):
+        """Drop every departure leaving before the given timestamp"""
+        for source, times in self._times.items():
+            cut = bisect_left(times, before)
+            if cut:
+                for leg in self._legs[source][:cut]:
+                    self._by_pk.pop(leg.pk, None)
+                del times[:cut]
+                del self._legs[source][:cut]
+
+    def departures(self, source, after, until):
+        times = self._times.get(source)
+        if not times:
+            return []
+        legs = self._legs[source]
+        start = bisect_left(times, after)
+        end = bisect_left(times, until, start)
+        return legs[start:end]
+
+    def search(self, source, destination, earliest, max_legs=3, min_transfer=1800,
+               max_wait=86400, budget_ms=200):
+        """
+        Label-setting search for the earliest-arriving and the cheapest
+        itineraries. Each label is (arrival, price, legs); a label reaching a
+        station is discarded when another label there is no worse on all
+        three, which keeps the frontier small on dense hubs.
+        """
+        started = time.perf_counter()
+        deadline = started + budget_ms / 1000.0
+        truncated = False
+
+        # Priority queues keyed on arrival time and on price respectively
+        by_arrival = []
+        by_price = []
+        labels = {}
+        counter = 0
+
+        def push(path):
+            nonlocal counter
+            leg = path[-1]
+            price = sum(l.price for l in path)
+            station_labels = labels.setdefault(leg.to_key, [])
+            for arrives, cost, hops in station_labels:
+                if arrives <= leg.arrives and cost <= price and hops <= len(path):
+                    return
+            station_labels.append((leg.arrives, price, len(path)))
+            counter += 1
+            heapq.heappush(by_arrival, (leg.arrives, price, counter, path))
+            heapq.heappush(by_price, (price, leg.arrives, counter, path))
+
+        source, destination = station_key(source), station_key(destination)
+        for leg in self.departures(source, earliest, earliest + max_wait):
+            if leg.seats > 0:
+                push((leg,))
+
+        fastest = self._settle(by_arrival, destination, max_legs, min_transfer,
+                               max_wait, push, deadline)
+        cheapest = self._settle(by_price, destination, max_legs, min_transfer,
+                                max_wait, push, deadline)
+        if time.perf_counter() > deadline:
+            truncated = True
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return SearchResult(
+            fastest=Itinerary(list(fastest)) if fastest else None,
+            cheapest=Itinerary(list(cheapest)) if cheapest else None,
+            elapsed_ms=elapsed_ms,
+            truncated=truncated,
+        )
+
+    def _settle(self, queue, destination, max_legs, min_transfer, max_wait, push, deadline):
+        pops = 0
+        while queue:
+            pops += 1
+            if pops % 256 == 0 and time.perf_counter() > deadline:
+                return None
+            path = heapq.heappop(queue)[-1]
+            last = path[-1]
+            if last.to_key == destination:
+                return path
+            if len(path) >= max_legs:
+                continue
+            visited = {leg.from_key for leg in path}
+            ready = last.arrives + min_transfer
+            for leg in self.departures(last.to_key, ready, ready + max_wait):
+                if leg.seats > 0 and leg.to_key not in visited:
+                    push(path + (leg,))
+        return None
+
+
+class ConnectionPlanner:
+    """
+    Process-wide planner. The graph is loaded lazily on first search, kept in
+    sync by the TravelOption signals and topped up from ``updated_at`` so
+    changes made by other worker processes are picked up without a rebuild.
+    Each refresh also loads the departures the rolling horizon has moved over,
+    and a periodic full rebuild drops rows deleted by other processes.
+    """
+
+    def __init__(self):
+        self.graph = ConnectionGraph()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._synced_at = None
+        self._horizon = None
+        self._checked_at = 0.0
+        self._rebuilt_at = 0.0
+
+    def _window(self, now):
+        return now, now + timedelta(days=_setting('CONNECTION_HORIZON_DAYS', 14))
+
+    def _queryset(self, start, end):
+        from ..models import TravelOption
+        return TravelOption.objects.filter(
+            departure_datetime__gte=start,
+            departure_datetime__lt=end,
+        ).only(
+            'pk', 'travel_id', 'type', 'source', 'destination', 'departure_datetime',
+            'arrival_datetime', 'price', 'available_seats', 'updated_at',
+        )
+
+    def rebuild(self):
+        with self._lock:
+            synced_at = timezone.now()
+            start, horizon = self._window(synced_at)
+            self.graph.bulk_load(
+                Leg.from_option(option) for option in self._queryset(start, horizon).iterator(chunk_size=5000)
+            )
+            self._synced_at = synced_at
+            self._horizon = horizon
+            self._checked_at = self._rebuilt_at = time.monotonic()
+            self._loaded = True
+
+    def refresh(self):
+        """Apply rows changed since the last sync, load the newly covered horizon and drop departed trips"""
+        with self._lock:
+            interval = _setting('CONNECTION_REBUILD_SECONDS', 3600)
+            if not self._loaded or time.monotonic() - self._rebuilt_at > interval:
+                self.rebuild()
+                return
+            synced_at = timezone.now()
+            start, horizon = self._window(synced_at)
+            for option in self._queryset(start, horizon).filter(updated_at__gte=self._synced_at):
+                self.graph.add(Leg.from_option(option))
+            # Unchanged departures that the horizon has moved over since the last sync
+            if horizon > self._horizon:
+                for option in self._queryset(max(start, self._horizon), horizon):
+                    self.graph.add(Leg.from_option(option))
+            self.graph.prune(synced_at.timestamp())
+            self._synced_at = synced_at
+            self._horizon = horizon
+            self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        interval = _setting('CONNECTION_REFRESH_SECONDS', 60)
+        if not self._loaded or time.monotonic() - self._checked_at > interval:
+            self.refresh()
+
+    def update_option(self, option):
+        if not self._loaded:
+            return
+        with self._lock:
+            now, horizon = self._window(timezone.now())
+            if now <= option.departure_datetime < horizon:
+                self.graph.add(Leg.from_option(option))
+            else:
+                self.graph.remove(option.pk)
+
+    def remove_option(self, pk):
+        if self._loaded:
+            with self._lock:
+                self.graph.remove(pk)
+
+    def search(self, source, destination, earliest=None, max_legs=None,
+               min_transfer_minutes=None, budget_ms=None):
+        self.ensure_fresh()
+        earliest = earliest or timezone.now()
+        with self._lock:
+            return self.graph.search(
+                source,
+                destination,
+                earliest.timestamp(),
+                max_legs=max_legs or _setting('CONNECTION_MAX_LEGS', 3),
+                min_transfer=60 * (min_transfer_minutes if min_transfer_minutes is not None
+                                   else _setting('CONNECTION_MIN_TRANSFER_MINUTES', 45)),
+                max_wait=3600 * _setting('CONNECTION_MAX_WAIT_HOURS', 24),
+                budget_ms=budget_ms or _setting('CONNECTION_SEARCH_BUDGET_MS', 200),
+            )
+
+
+planner = ConnectionPlanner()
@@ -5,8 +5,10 @@ from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.html import strip_tags
+from .timing import timed_step
 
 
+@timed_step('email.booking_confirmation')
 def send_booking_confirmation_email(booking):
     """
     Send booking confirmation email to the user
@@ -41,6 +43,7 @@ def send_booking_confirmation_email(booking):
         return False
 
 
+@timed_step('email.cancellation')
 def send_cancellation_email(booking):
     """
     Send booking cancellation email to the user
@@ -78,6 +81,7 @@ def send_cancellation_email(booking):
         return False
 
 
+@timed_step('email.reminder')
 def send_reminder_email(booking):
     """
     Send booking reminder email 24 hours before departure
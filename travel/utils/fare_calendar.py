@@ -0,0 +1,131 @@
+"""
+Precomputed low-fare calendar.
+
+Each FareCalendarDay row holds the cheapest bookable fare, the seats left and
+the number of departures for one (source, destination, type, day) bucket.
+Buckets are recomputed one at a time whenever a TravelOption in them changes,
+so serving the calendar is a single indexed read instead of a grouped scan.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum, Q
+from django.utils import timezone
+
+from ..models import FareCalendarDay, TravelOption
+
+
+def calendar_days():
+    return getattr(settings, 'FARE_CALENDAR_DAYS', 60)
+
+
+def bucket_for(source, destination, type, departure):
+    return (source, destination, type, timezone.localdate(departure))
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def refresh_bucket(source, destination, type, day):
+    """Recompute a single bucket from its departures"""
+    start, end = _day_bounds(day)
+    stats = TravelOption.objects.filter(
+        source=source,
+        destination=destination,
+        type=type,
+        departure_datetime__gte=start,
+        departure_datetime__lt=end,
+    ).aggregate(
+        min_price=Min('price', filter=Q(available_seats__gt=0)),
+        available_seats=Sum('available_seats'),
+        departures=Count('id'),
+    )
+    if not stats['departures']:
+        FareCalendarDay.objects.filter(
+            source=source, destination=destination, type=type, day=day
+        ).delete()
+        return None
+    row, _ = FareCalendarDay.objects.update_or_create(
+        source=source,
+        destination=destination,
+        type=type,
+        day=day,
+        defaults={
+            'min_price': stats['min_price'],
+            'available_seats': stats['available_seats'] or 0,
+            'departures': stats['departures'],
+        },
+    )
+    return row
+
+
+def rebuild(days=None):
+    """Recompute every bucket from today onwards in one grouped pass"""
+    days = days or calendar_days()
+    today = timezone.localdate()
+    start, _ = _day_bounds(today)
+    end = start + timedelta(days=days)
+
+    # One transaction: readers never see a half-built calendar, and bucket
+    # refreshes queued by concurrent saves run before or after it, not in between
+    with transaction.atomic():
+        buckets = {}
+        options = TravelOption.objects.filter(
+            departure_datetime__gte=start, departure_datetime__lt=end
+        ).values_list('source', 'destination', 'type', 'departure_datetime', 'price', 'available_seats')
+        for source, destination, type, departure, price, seats in options.iterator(chunk_size=5000):
+            key = bucket_for(source, destination, type, departure)
+            entry = buckets.setdefault(key, [None, 0, 0])
+            if seats > 0 and (entry[0] is None or price < entry[0]):
+                entry[0] = price
+            entry[1] += seats
+            entry[2] += 1
+
+        FareCalendarDay.objects.filter(day__gte=today).delete()
+        FareCalendarDay.objects.bulk_create(
+            [
+                FareCalendarDay(
+                    source=source, destination=destination, type=type, day=day,
+                    min_price=min_price, available_seats=seats, departures=departures,
+                )
+                for (source, destination, type, day), (min_price, seats, departures) in buckets.items()
+            ],
+            batch_size=1000,
+        )
+        FareCalendarDay.objects.filter(day__lt=today).delete()
+    return len(buckets)
+
+
+def get_calendar(source, destination, type=None, start=None, days=None):
+    """
+    Cheapest fare per day for a route. Without a type the buckets for all
+    travel types are merged.
+    """
+    start = start or timezone.localdate()
+    days = days or calendar_days()
+    rows = FareCalendarDay.objects.filter(
+        source=source,
+        destination=destination,
+        day__gte=start,
+        day__lt=start + timedelta(days=days),
+    )
+    if type:
+        rows = rows.filter(type=type)
+
+    merged = {}
+    for row in rows:
+        entry = merged.setdefault(row.day, {'min_price': None, 'available_seats': 0, 'departures': 0})
+        if row.min_price is not None and (entry['min_price'] is None or row.min_price < entry['min_price']):
+            entry['min_price'] = row.min_price
+        entry['available_seats'] += row.available_seats
+        entry['departures'] += row.departures
+
+    calendar = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        entry = merged.get(day, {'min_price': None, 'available_seats': 0, 'departures': 0})
+        calendar.append({'date': day, **entry})
+    return calendar
@@ -1,23 +1,26 @@
 """
 Utility functions for generating PDF tickets
+
+ReportLab, qrcode and Pillow are imported inside the functions so that they
+are only loaded by workers that actually render a PDF, not at startup.
 """
 from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from reportlab.pdfgen import canvas
-from django.conf import settings
-import qrcode
-import os
+from .timing import timed_step
 
 
+@timed_step('pdf.ticket')
 def generate_ticket_pdf(booking):
     """
     Generate a PDF ticket for the booking
     """
+    import qrcode
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
@@ -210,10 +213,18 @@ def generate_ticket_pdf(booking):
     return buffer
 
 
+@timed_step('pdf.cancellation_receipt')
 def generate_cancellation_receipt_pdf(booking):
     """
     Generate a PDF receipt for cancelled booking
     """
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
@@ -0,0 +1,178 @@
+"""
+Price history of departures.
+
+record() appends one PriceHistory row per price change. The pricing engine,
+the timetable import and TravelOption.save() (through the post_save signal)
+call it in the transaction that changes the price; creating a departure or
+changing only its seats writes nothing. The first change of a departure also
+records the price it had before, stamped with its creation time, so every
+series starts from the original fare.
+
+Reads:
+- series(): one departure's prices over time, from the
+  (travel_option_id, recorded_at) index.
+- route_daily_min(): the lowest fare in effect on a route each day. Each
+  departure's price is carried forward from its last change (or its
+  creation, for departures never repriced) until it departs; the route's
+  changes come from the covering (source, destination, recorded_at, price)
+  index.
+
+downsample() thins old rows to the lowest and the last price of each
+departure and day. That keeps route minima exact and series continuous at
+daily resolution.
+"""
+from datetime import datetime, timedelta
+
+from django.db import connections, router
+from django.db.models import Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import ArchivedTravelOption, PriceHistory, TravelOption
+
+
+COLUMNS = ('travel_option_id', 'source', 'destination', 'recorded_at', 'price')
+
+
+def record(changes, at=None):
+    """
+    Append rows for ``changes``, (travel_option_id, source, destination,
+    old_price, new_price) tuples whose prices differ.
+    """
+    if not changes:
+        return
+    alias = router.db_for_write(PriceHistory)
+    db = connections[alias]
+    at = at or timezone.now()
+    ids = [change[0] for change in changes]
+    seeded = set(
+        PriceHistory.objects.using(alias).filter(travel_option_id__in=ids)
+        .values_list('travel_option_id', flat=True).distinct()
+    )
+    unseeded = [change for change in changes if change[0] not in seeded]
+    created = dict(
+        TravelOption.objects.using(alias).filter(pk__in=[change[0] for change in unseeded])
+        .values_list('pk', 'created_at')
+    ) if unseeded else {}
+
+    # One executemany instead of bulk_create: this runs for every repriced
+    # departure and model instances would cost more than the INSERT itself.
+    # For the same reason values go through the backend's adapter for their
+    # column rather than get_db_prep_save(), and ``at`` is adapted once.
+    fields = [PriceHistory._meta.get_field(name) for name in COLUMNS]
+    price = PriceHistory._meta.get_field('price')
+    stamp = db.ops.adapt_datetimefield_value
+
+    def adapt_price(value):
+        return db.ops.adapt_decimalfield_value(value, price.max_digits, price.decimal_places)
+
+    recorded = stamp(at)
+    rows = [(pk, source, destination, stamp(created[pk]) if pk in created else recorded, adapt_price(old))
+            for pk, source, destination, old, new in unseeded]
+    rows += [(pk, source, destination, recorded, adapt_price(new)) for pk, source, destination, old, new in changes]
+    quote = db.ops.quote_name
+    sql = (
+        f'INSERT INTO {quote(PriceHistory._meta.db_table)} ({", ".join(quote(f.column) for f in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))})'
+    )
+    with db.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def series(travel_option_id, since=None):
+    """[(recorded_at, price)] of one departure, oldest first"""
+    rows = PriceHistory.objects.filter(travel_option_id=travel_option_id)
+    if since:
+        rows = rows.filter(recorded_at__gte=since)
+    return list(rows.order_by('recorded_at').values_list('recorded_at', 'price'))
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def route_daily_min(source, destination, days=30):
+    """
+    [(day, lowest price)] in effect on the route over the last ``days`` days,
+    oldest first. A departure counts on every day from its creation until it
+    leaves, at the price it had at the start of the day and at every price it
+    was given during the day. Days without a bookable departure are left out.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    first = today - timedelta(days=days - 1)
+    since = _day_start(first)
+
+    departures = {}
+    for model in (TravelOption, ArchivedTravelOption):
+        departures.update(
+            (pk, (created, departs, price)) for pk, created, departs, price in model.objects.filter(
+                source=source, destination=destination, departure_datetime__gt=since, created_at__lte=now,
+            ).values_list('pk', 'created_at', 'departure_datetime', 'price')
+        )
+    if not departures:
+        return []
+
+    # Each departure's (from, price) steps; without history its price never changed
+    steps = {}
+    changes = PriceHistory.objects.filter(
+        source=source, destination=destination,
+        recorded_at__gte=min(created for created, _, _ in departures.values()), recorded_at__lte=now,
+    ).order_by('recorded_at').values_list('travel_option_id', 'recorded_at', 'price')
+    for pk, at, price in changes.iterator(chunk_size=5000):
+        if pk in departures:
+            steps.setdefault(pk, []).append((at, price))
+
+    lowest = {}
+    for pk, (created, departs, price) in departures.items():
+        timeline = steps.get(pk) or [(created, price)]
+        end = min(departs, now)
+        for index, (start, price) in enumerate(timeline):
+            until = min(timeline[index + 1][0], end) if index + 1 < len(timeline) else end
+            if start > end:
+                break
+            if until < since:
+                continue
+            # Every local day the price was in effect during; a step ending at
+            # midnight doesn't reach into the next day
+            day = max(timezone.localdate(start), first)
+            last = timezone.localdate(until - timedelta(microseconds=1)) if until > start else day
+            while day <= last:
+                if day not in lowest or price < lowest[day]:
+                    lowest[day] = price
+                day += timedelta(days=1)
+    return sorted(lowest.items())
+
+
+def _surplus(group):
+    """Ids in one departure-day group other than its lowest and its last price"""
+    if len(group) <= 2:
+        return []
+    lowest = min(group, key=lambda row: row[2])
+    return [row[0] for row in group[:-1] if row is not lowest]
+
+
+def downsample(before, after=None, chunk_size=5000):
+    """
+    Keep only the lowest and the last price per departure and day among rows
+    recorded in [after, before). Returns the number of rows deleted.
+    """
+    rows = PriceHistory.objects.filter(recorded_at__lt=before)
+    if after:
+        rows = rows.filter(recorded_at__gte=after)
+    # Rows are read first and deleted afterwards, so no cursor is open on the
+    # table while it shrinks
+    surplus, group, key = [], [], None
+    for row in rows.order_by('travel_option_id', 'recorded_at').values_list(
+        'id', 'travel_option_id', 'price', 'recorded_at'
+    ).iterator(chunk_size=chunk_size):
+        row_key = (row[1], timezone.localdate(row[3]))
+        if row_key != key:
+            surplus += _surplus(group)
+            group, key = [], row_key
+        group.append(row)
+    surplus += _surplus(group)
+
+    for start in range(0, len(surplus), chunk_size):
+        PriceHistory.objects.filter(pk__in=surplus[start:start + chunk_size]).delete()
+    return len(surplus)
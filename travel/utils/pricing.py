@@ -0,0 +1,215 @@
+"""
+Dynamic pricing.
+
+reprice() sets every upcoming departure's price to its base_price times
+three factors. Each factor is a piecewise-linear curve from PRICING_RULES:
+
+- load factor: the share of capacity already sold;
+- time to departure, in hours;
+- route demand: confirmed bookings made on the route during the last
+  ``demand_window_days``, per upcoming departure, relative to the average
+  over all routes.
+
+The inputs are read once into NumPy arrays, and every price is computed in
+one vectorized pass. Only prices that move by at least ``min_change_pct`` are
+written back, one hand-built ``UPDATE ... SET price = CASE id WHEN ... END``
+statement per chunk rather than QuerySet.bulk_update() (see write()). Each
+chunk is its own transaction and writes only price and updated_at (and the
+PriceHistory rows of the changes), so concurrent bookings wait briefly at most
+and keep their seat counts. Bookings store the fare they were sold at
+(Booking.unit_price), so repricing never changes what a customer paid.
+"""
+import time
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import Booking, TravelOption
+from . import price_history
+
+
+CURVES = ('load_factor', 'hours_to_departure', 'route_demand')
+
+DEFAULT_RULES = {
+    # (x, multiplier) points, interpolated linearly and flat beyond the ends
+    'load_factor': [(0.0, 0.9), (0.5, 1.0), (0.8, 1.2), (1.0, 1.5)],
+    'hours_to_departure': [(0, 1.3), (24, 1.2), (72, 1.1), (168, 1.0), (720, 0.95)],
+    'route_demand': [(0.0, 0.95), (1.0, 1.0), (3.0, 1.2)],
+    'demand_window_days': 14,
+    # Bounds for the product of the three factors
+    'min_multiplier': 0.7,
+    'max_multiplier': 2.0,
+    # Smaller moves are not written, so prices don't churn between runs
+    'min_change_pct': 1.0,
+}
+
+
+def rules():
+    """DEFAULT_RULES updated with settings.PRICING_RULES"""
+    merged = {**DEFAULT_RULES, **getattr(settings, 'PRICING_RULES', {})}
+    for name in CURVES:
+        xs = [x for x, _ in merged[name]]
+        if not xs or xs != sorted(xs):
+            raise ImproperlyConfigured(f'PRICING_RULES["{name}"] needs (x, multiplier) points in increasing x')
+    if merged['min_multiplier'] > merged['max_multiplier']:
+        raise ImproperlyConfigured('PRICING_RULES min_multiplier is above max_multiplier')
+    return merged
+
+
+def _curve(points, x):
+    xs, ys = zip(*points)
+    return np.interp(x, xs, ys)
+
+
+def _epoch_seconds(values):
+    """Seconds since the epoch of raw DATETIME values: UTC strings on SQLite, datetimes elsewhere"""
+    if values and not isinstance(values[0], str):
+        values = [v.astimezone(dt_timezone.utc).replace(tzinfo=None) if v.tzinfo else v for v in values]
+    return np.array(values, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+def load(now, window_days):
+    """Column arrays of every departure after ``now``, keyed by name"""
+    query = TravelOption.objects.filter(departure_datetime__gt=now).order_by().values_list(
+        'pk', 'source', 'destination', 'departure_datetime', 'price', 'base_price', 'capacity', 'available_seats',
+    ).query
+    # A plain cursor on the primary skips Django's per-value converters
+    # (Decimal and datetime objects), which cost more than the pricing itself
+    sql, params = query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = list(zip(*cursor.fetchall())) or [()] * 8
+    pks, sources, destinations, departures, prices, bases, capacities, seats = columns
+    count = len(pks)
+
+    routes = {}
+    route = np.fromiter(
+        (routes.setdefault(key, len(routes)) for key in zip(sources, destinations)), np.int64, count
+    )
+    price = np.rint(np.fromiter(prices, float, count) * 100).astype(np.int64)
+    base = np.rint(np.fromiter(
+        (b if b is not None else p for b, p in zip(bases, prices)), float, count
+    ) * 100).astype(np.int64)
+    available = np.fromiter(seats, np.int64, count)
+    # Without a recorded capacity the departure counts as empty
+    capacity = np.maximum(np.fromiter((c or 0 for c in capacities), np.int64, count), available)
+    hours = (_epoch_seconds(departures) - now.timestamp()) / 3600
+
+    booked = np.zeros(len(routes))
+    recent = Booking.objects.filter(
+        status='CONFIRMED', booking_date__gte=now - timedelta(days=window_days)
+    ).values_list('travel_option__source', 'travel_option__destination').annotate(n=Count('id')).order_by()
+    for source, destination, n in recent:
+        index = routes.get((source, destination))
+        if index is not None:
+            booked[index] = n
+    per_departure = booked / np.maximum(np.bincount(route, minlength=len(routes)), 1)
+    average = booked.sum() / count if count else 0
+    demand = per_departure / average if average else np.ones(len(routes))
+
+    return {
+        'pk': np.fromiter(pks, np.int64, count),
+        'price': price,
+        'base': base,
+        'capacity': capacity,
+        'available': available,
+        'hours': hours,
+        'demand': demand[route] if count else np.zeros(0),
+        'route': route,
+        'routes': list(routes),
+    }
+
+
+def compute(columns, rules):
+    """New prices in cents and the multipliers behind them"""
+    capacity = columns['capacity']
+    load_factor = np.divide(
+        capacity - columns['available'], capacity, out=np.zeros(len(capacity)), where=capacity > 0
+    )
+    multiplier = (
+        _curve(rules['load_factor'], load_factor)
+        * _curve(rules['hours_to_departure'], columns['hours'])
+        * _curve(rules['route_demand'], columns['demand'])
+    )
+    np.clip(multiplier, rules['min_multiplier'], rules['max_multiplier'], out=multiplier)
+    return np.rint(columns['base'] * multiplier).astype(np.int64), multiplier
+
+
+def changed_rows(old, new, min_change_pct):
+    """Mask of the prices worth writing: moved by min_change_pct and at least one cent"""
+    return np.abs(new - old) >= np.maximum(old * (min_change_pct / 100), 1)
+
+
+def write(columns, cents, mask, batch_size):
+    """
+    Store the ``mask``ed new prices (``cents``) and their price history, one
+    ``UPDATE ... SET price = CASE id WHEN ... END`` statement and transaction
+    per chunk.
+    """
+    # The statement QuerySet.bulk_update() would send, built directly: its
+    # per-row Case/When expressions cost about a millisecond a row, and its
+    # placeholders cap SQLite chunks at 333 rows. Keys and prices are ints
+    # from the arrays, so they are written as literals.
+    opts = TravelOption._meta
+    quote = connection.ops.quote_name
+    table, pk, price = quote(opts.db_table), quote(opts.pk.column), quote(opts.get_field('price').column)
+    updated_field = opts.get_field('updated_at')
+    # updated_at is set too: the connection planner picks up changes by it
+    now = timezone.now()
+    updated_at = updated_field.get_db_prep_save(now, connection)
+    pks, cents, old = columns['pk'][mask].tolist(), cents[mask].tolist(), columns['price'][mask].tolist()
+    routes = [columns['routes'][index] for index in columns['route'][mask].tolist()]
+    for start in range(0, len(pks), batch_size):
+        chunk = slice(start, start + batch_size)
+        cases = ' '.join(
+            f'WHEN {key} THEN {value // 100}.{value % 100:02d}' for key, value in zip(pks[chunk], cents[chunk])
+        )
+        sql = (
+            f'UPDATE {table} SET {price} = CASE {pk} {cases} END, {quote(updated_field.column)} = %s '
+            f'WHERE {pk} IN ({", ".join(map(str, pks[chunk]))})'
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [updated_at])
+            price_history.record([
+                (key, source, destination, Decimal(before).scaleb(-2), Decimal(after).scaleb(-2))
+                for key, (source, destination), before, after
+                in zip(pks[chunk], routes[chunk], old[chunk], cents[chunk])
+            ], at=now)
+
+
+def reprice(batch_size=2000, dry_run=False, now=None):
+    """
+    Reprice every upcoming departure. Returns a dict with the number of
+    departures and changed prices, the multipliers, and seconds per phase.
+    """
+    now = now or timezone.now()
+    current = rules()
+    timings = {}
+
+    started = time.perf_counter()
+    columns = load(now, current['demand_window_days'])
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cents, multiplier = compute(columns, current)
+    mask = changed_rows(columns['price'], cents, current['min_change_pct'])
+    timings['compute'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if not dry_run:
+        write(columns, cents, mask, batch_size)
+    timings['write'] = time.perf_counter() - started
+
+    return {
+        'departures': len(cents),
+        'changed': int(mask.sum()),
+        'multiplier': multiplier,
+        'timings': timings,
+    }
@@ -0,0 +1,149 @@
+"""
+On-demand request profiling.
+
+ProfilerMiddleware runs a request under cProfile when a superuser adds
+``?_profile=1`` to the URL and returns a plain-text report instead of the
+page: request summary, top functions by cumulative and own time, the call
+tree below the hottest functions, and every SQL statement executed. With
+PROFILER_DIR set the raw stats (``.prof``, readable by pstats/snakeviz) and
+the report (``.txt``) are also saved there for later comparison.
+
+cProfile only sees the thread it is enabled on. Under WSGI the request is
+profiled on its worker thread and an async view runs on an event loop thread;
+under ASGI (aprofile_request) the request is profiled on the event loop and a
+sync view runs on a thread. profiled_view() profiles such a view where it
+runs, and the report merges both profiles. Under ASGI the loop is shared, so
+its profile can include other requests served meanwhile.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.conf import settings
+from django.utils import timezone
+
+from .query_tracking import QueryRecorder
+
+
+TOP_FUNCTIONS = 40
+CALL_TREE_FUNCTIONS = 15
+
+
+def profiler_dir():
+    return getattr(settings, 'PROFILER_DIR', None)
+
+
+def _stats_text(profiles, sort, amount, callees=False):
+    out = io.StringIO()
+    stats = pstats.Stats(*profiles, stream=out).strip_dirs().sort_stats(sort)
+    if callees:
+        stats.print_callees(amount)
+    else:
+        stats.print_stats(amount)
+    return out.getvalue().strip()
+
+
+def build_report(request, response, profiles, recorder, elapsed):
+    """Plain-text profile report for one request"""
+    lines = [
+        f'{request.method} {request.get_full_path()}',
+        f'Status:   {response.status_code}',
+        f'Wall:     {elapsed * 1000:.1f} ms',
+        f'SQL:      {recorder.count} queries, {recorder.total_time * 1000:.1f} ms',
+        '',
+        '=== Top functions by cumulative time ===',
+        _stats_text(profiles, 'cumulative', TOP_FUNCTIONS),
+        '',
+        '=== Top functions by own time ===',
+        _stats_text(profiles, 'tottime', TOP_FUNCTIONS),
+        '',
+        '=== Call tree (callees of the hottest functions) ===',
+        _stats_text(profiles, 'cumulative', CALL_TREE_FUNCTIONS, callees=True),
+        '',
+        '=== SQL ===',
+    ]
+    for number, query in enumerate(recorder.queries, 1):
+        lines.append(f'{number:>3}. [{query["alias"]}] {query["duration"] * 1000:.2f} ms  {query["sql"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def save_report(request, profiles, report):
+    """Write <timestamp>-<view>.prof and .txt to PROFILER_DIR; returns the base path"""
+    directory = profiler_dir()
+    if not directory:
+        return None
+    match = getattr(request, 'resolver_match', None)
+    name = re.sub(r'[^\w.-]+', '_', match.view_name if match else request.path).strip('_') or 'root'
+    base = os.path.join(directory, f'{timezone.now():%Y%m%d-%H%M%S-%f}-{name}')
+    os.makedirs(directory, exist_ok=True)
+    pstats.Stats(*profiles).dump_stats(f'{base}.prof')
+    with open(f'{base}.txt', 'w') as fh:
+        fh.write(report)
+    return base
+
+
+def profile_request(get_response, request):
+    """Run the request under cProfile; returns (response, profiles, recorder, elapsed)"""
+    profile = cProfile.Profile()
+    request._profiles = [profile]
+    request._profiled_on_loop = False
+    with QueryRecorder() as recorder:
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profile.disable()
+        elapsed = time.perf_counter() - started
+    return response, request._profiles, recorder, elapsed
+
+
+async def aprofile_request(get_response, request):
+    """profile_request() for an async get_response, profiling the event loop thread"""
+    profile = cProfile.Profile()
+    request._profiles = [profile]
+    request._profiled_on_loop = True
+    with QueryRecorder() as recorder:
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = await get_response(request)
+        finally:
+            profile.disable()
+        elapsed = time.perf_counter() - started
+    return response, request._profiles, recorder, elapsed
+
+
+def profiled_view(request, view_func, view_args, view_kwargs):
+    """
+    Response of the view run with its own profile on the thread it runs on,
+    or None when the request isn't profiled or the request's profile already
+    covers that thread (a sync view under WSGI, an async one under ASGI).
+    """
+    profiles = getattr(request, '_profiles', None)
+    is_async = iscoroutinefunction(view_func)
+    if profiles is None or is_async == request._profiled_on_loop:
+        return None
+    profile = cProfile.Profile()
+    profiles.append(profile)
+
+    if not is_async:
+        profile.enable()
+        try:
+            return view_func(request, *view_args, **view_kwargs)
+        finally:
+            profile.disable()
+
+    async def run():
+        profile.enable()
+        try:
+            return await view_func(request, *view_args, **view_kwargs)
+        finally:
+            profile.disable()
+
+    return async_to_sync(run)()
@@ -0,0 +1,92 @@
+"""
+Query recording and N+1 detection.
+
+QueryRecorder hooks every database connection through Django's execute
+wrappers and records each statement with its duration. Statements are grouped
+by "shape" (the SQL with parameters and IN-lists collapsed); the same shape
+executed many times in one request is the signature of an N+1 loop.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACE = re.compile(r'\s+')
+
+
+def sql_shape(sql):
+    """Normalise SQL so queries differing only in parameters compare equal"""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _IN_LIST.sub('(...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+
+class QueryRecorder:
+    """
+    Context manager recording every query run on any connection while active.
+
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.duplicates()
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'alias': context['connection'].alias,
+                'duration': time.perf_counter() - started,
+            })
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        aliases = [self.using] if self.using else list(connections)
+        for alias in aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+
+    @property
+    def count(self):
+        return len([q for q in self.queries if not q['sql'].lstrip().upper().startswith(
+            ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+        )])
+
+    @property
+    def total_time(self):
+        return sum(q['duration'] for q in self.queries)
+
+    def duplicates(self, threshold=None):
+        """Shapes executed at least ``threshold`` times, most repeated first"""
+        threshold = threshold or n_plus_one_threshold()
+        shapes = Counter(sql_shape(q['sql']) for q in self.queries)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+def query_budget(url_name):
+    """Configured maximum number of queries for a URL name, or None"""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
@@ -0,0 +1,158 @@
+"""
+Lazy materialization of recurring schedules.
+
+A Schedule describes a service (route, weekdays, departure time, price,
+capacity) instead of storing one TravelOption per date. Before a search
+reads TravelOption, ensure_materialized() creates the departures of every
+active schedule for the rolling window, SCHEDULE_HORIZON_DAYS ahead. Each
+schedule remembers how far it has been materialized, so once the window is
+covered a search pays one indexed query, or nothing while the shared cache
+remembers the covered date.
+
+A dated search past the window gets ensure_dates() instead: only the
+searched days, only for the schedules the search can match, and
+materialized_until is left alone. A single far-off search therefore adds a
+few rows rather than months of departures for every schedule.
+
+Departures get deterministic travel_ids (CODE-YYYYMMDD) and are inserted
+with ignore_conflicts, so workers racing on the same dates are harmless.
+Editing a schedule only affects dates that are not materialized yet; the
+existing departures may already hold bookings.
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Schedule, TravelOption
+from . import fare_calendar
+from .autocomplete import cities
+
+
+MEMO_KEY = 'schedules:materialized_until'
+
+
+def horizon_days():
+    return getattr(settings, 'SCHEDULE_HORIZON_DAYS', 60)
+
+
+def max_days():
+    return getattr(settings, 'SCHEDULE_MAX_DAYS', 366)
+
+
+def window_end(days=None):
+    """Exclusive end date of the rolling window every search sees materialized"""
+    today = timezone.localdate()
+    return today + timedelta(days=min(days if days is not None else horizon_days(), max_days()))
+
+
+def departures_for(schedule, start, end):
+    """Unsaved TravelOptions for the schedule's service days in [start, end)"""
+    now = timezone.now()
+    options = []
+    day = start
+    while day < end:
+        if schedule.runs_on(day):
+            departure = timezone.make_aware(datetime.combine(day, schedule.departure_time))
+            if departure > now:
+                options.append(TravelOption(
+                    travel_id=f'{schedule.code}-{day:%Y%m%d}',
+                    type=schedule.type,
+                    source=schedule.source,
+                    destination=schedule.destination,
+                    departure_datetime=departure,
+                    arrival_datetime=departure + schedule.duration,
+                    price=schedule.price,
+                    base_price=schedule.price,
+                    available_seats=schedule.capacity,
+                    capacity=schedule.capacity,
+                    schedule=schedule,
+                ))
+        day += timedelta(days=1)
+    return options
+
+
+def materialize(schedule, until):
+    """Create the schedule's departures up to ``until`` (exclusive) and return them"""
+    start = max(schedule.materialized_until or schedule.valid_from, schedule.valid_from, timezone.localdate())
+    options = departures_for(schedule, start, until) if start < until else []
+    with transaction.atomic():
+        if options:
+            TravelOption.objects.bulk_create(options, ignore_conflicts=True)
+        Schedule.objects.filter(pk=schedule.pk).filter(
+            Q(materialized_until__isnull=True) | Q(materialized_until__lt=until)
+        ).update(materialized_until=until)
+    return options
+
+
+def _sync_derived(options):
+    """
+    bulk_create sends no signals: refresh the calendar buckets of the new
+    departures and have the city index rebuilt in the background. This runs
+    after a search, so it never rebuilds the calendar in full; that is left
+    to materialize_schedules, which writes the bulk of the departures.
+    """
+    buckets = {
+        fare_calendar.bucket_for(o.source, o.destination, o.type, o.departure_datetime) for o in options
+    }
+    for bucket in buckets:
+        fare_calendar.refresh_bucket(*bucket)
+    cities.invalidate(time.monotonic(), wait=False)
+
+
+def ensure_materialized(until, sync=True):
+    """
+    Materialize every active schedule up to ``until``; returns the number of
+    departures written. With sync=False the caller brings the fare calendar
+    up to date itself.
+    """
+    covered = cache.get(MEMO_KEY)
+    if covered is not None and covered >= until:
+        return 0
+    pending = Schedule.objects.filter(active=True).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=until)
+    )
+    created = []
+    for schedule in pending.iterator():
+        created += materialize(schedule, until)
+    if created and sync:
+        transaction.on_commit(lambda: _sync_derived(created))
+    cache.set(MEMO_KEY, until, getattr(settings, 'SCHEDULE_CHECK_SECONDS', 60))
+    return len(created)
+
+
+def ensure_dates(start, end, matching):
+    """
+    Create the departures in [start, end) past the rolling window for the
+    ``matching`` schedules only, leaving materialized_until alone. Returns
+    the number of departures written.
+    """
+    start = max(start, window_end())
+    end = min(end, timezone.localdate() + timedelta(days=max_days()))
+    if start >= end:
+        return 0
+    options = []
+    pending = matching.filter(active=True).filter(Q(materialized_until__isnull=True) | Q(materialized_until__lt=end))
+    for schedule in pending.iterator():
+        options += departures_for(schedule, max(start, schedule.materialized_until or start), end)
+    if not options:
+        return 0
+    # Skip the write (and the write lock) when an earlier search created them
+    existing = set(TravelOption.objects.filter(
+        travel_id__in=[option.travel_id for option in options]
+    ).values_list('travel_id', flat=True))
+    missing = [option for option in options if option.travel_id not in existing]
+    if missing:
+        with transaction.atomic():
+            TravelOption.objects.bulk_create(missing, ignore_conflicts=True)
+        transaction.on_commit(lambda: _sync_derived(missing))
+    return len(missing)
+
+
+def forget_coverage():
+    """A schedule was added or changed: the next search checks the schedules again"""
+    cache.delete(MEMO_KEY)
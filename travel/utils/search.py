@@ -0,0 +1,178 @@
+"""
+Travel option search: filters and sort orders for travel_list.
+
+Every supported sort order is backed by a composite index on TravelOption,
+with and without a leading ``type`` column, so results come straight off the
+index in order. A range on the leading sort column is read as an index
+range; a price range under another sort is applied as a residual filter on
+the rows the index returns. A date is only a range on the departure index,
+so date searches are always sorted by departure.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ..models import Schedule, TravelOption
+
+
+SORT_ORDERS = {
+    'departure': ('departure_datetime', 'id'),
+    'price': ('price', 'departure_datetime', 'id'),
+    'seats': ('-available_seats', 'departure_datetime', 'id'),
+}
+
+SORT_LABELS = {
+    'departure': 'Departure Time',
+    'price': 'Price (Low to High)',
+    'seats': 'Available Seats',
+}
+
+# Range filters each sort order's index can serve
+SORT_RANGE_FILTERS = {
+    'departure': {'date'},
+    'price': {'price'},
+    'seats': set(),
+}
+
+# Range filters that can instead be checked row by row under any sort order
+RESIDUAL_FILTERS = {'price'}
+
+DEFAULT_SORT = 'departure'
+
+
+class UnsupportedSearch(ValueError):
+    """The requested filter/sort combination has no matching index"""
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def _parse_price(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise UnsupportedSearch(f'{name} must be a number.')
+    if price < 0:
+        raise UnsupportedSearch(f'{name} cannot be negative.')
+    return price
+
+
+def flex_window(value):
+    """Number of days either side of the searched date, capped at FLEX_DATE_MAX_DAYS"""
+    try:
+        flex = int(value or 0)
+    except ValueError:
+        return 0
+    return max(0, min(flex, getattr(settings, 'FLEX_DATE_MAX_DAYS', 7)))
+
+
+def range_filters(params):
+    """Names of the range filters present in the request"""
+    used = set()
+    if _parse_day(params.get('date')):
+        used.add('date')
+    if params.get('min_price') or params.get('max_price'):
+        used.add('price')
+    return used
+
+
+def available_sorts(params):
+    """Sort orders that can be combined with the request's current filters"""
+    used = range_filters(params) - RESIDUAL_FILTERS
+    return [key for key in SORT_ORDERS if used <= SORT_RANGE_FILTERS[key]]
+
+
+def resolve_sort(params):
+    """
+    Sort order a search runs with: the requested one, or the departure order
+    when the requested index cannot serve the request's date range.
+    """
+    sort = params.get('sort') or DEFAULT_SORT
+    if sort not in SORT_ORDERS:
+        raise UnsupportedSearch(f'Unknown sort order "{sort}".')
+    if sort not in available_sorts(params):
+        return DEFAULT_SORT
+    return sort
+
+
+def matching_schedules(params):
+    """Schedules whose departures a search with ``params`` can return"""
+    qs = Schedule.objects.all()
+    if params.get('type'):
+        qs = qs.filter(type=params['type'].upper())
+    if params.get('source'):
+        qs = qs.filter(source__icontains=params['source'])
+    if params.get('destination'):
+        qs = qs.filter(destination__icontains=params['destination'])
+    if params.get('q'):
+        q = params['q']
+        qs = qs.filter(Q(source__icontains=q) | Q(destination__icontains=q) | Q(code__icontains=q))
+    return qs
+
+
+def search_travel_options(params):
+    """
+    Build the travel_list queryset from request parameters.
+    Returns (queryset, day, flex); raises UnsupportedSearch on bad input.
+    The queryset is ordered by resolve_sort(params).
+    """
+    sort = resolve_sort(params)
+    qs = TravelOption.objects.order_by(*SORT_ORDERS[sort])
+
+    ttype = params.get('type')
+    src = params.get('source')
+    dst = params.get('destination')
+    q = params.get('q')
+
+    # Equality on type keeps it usable as the leading index column
+    if ttype:
+        qs = qs.filter(type=ttype.upper())
+    if src:
+        qs = qs.filter(source__icontains=src)
+    if dst:
+        qs = qs.filter(destination__icontains=dst)
+    if q:
+        qs = qs.filter(
+            Q(source__icontains=q) |
+            Q(destination__icontains=q) |
+            Q(travel_id__icontains=q)
+        )
+
+    min_price = _parse_price(params.get('min_price'), 'min_price')
+    max_price = _parse_price(params.get('max_price'), 'max_price')
+    if min_price is not None or max_price is not None:
+        price = 'price'
+        if 'price' not in SORT_RANGE_FILTERS[sort]:
+            # Residual: "price + 0" cannot be read off the price index, so the
+            # planner keeps walking the sort order's index
+            qs = qs.alias(residual_price=ExpressionWrapper(F('price') + 0, output_field=FloatField()))
+            price = 'residual_price'
+            min_price = None if min_price is None else float(min_price)
+            max_price = None if max_price is None else float(max_price)
+        if min_price is not None:
+            qs = qs.filter(**{f'{price}__gte': min_price})
+        if max_price is not None:
+            qs = qs.filter(**{f'{price}__lte': max_price})
+
+    # Date search is a half-open range on departure_datetime so the index is
+    # used; with flex=N the window widens to N days either side
+    day = _parse_day(params.get('date'))
+    flex = 0
+    if day:
+        flex = flex_window(params.get('flex'))
+        start = timezone.make_aware(datetime.combine(day - timedelta(days=flex), datetime.min.time()))
+        qs = qs.filter(
+            departure_datetime__gte=start,
+            departure_datetime__lt=start + timedelta(days=2 * flex + 1),
+        )
+    return qs, day, flex
@@ -0,0 +1,153 @@
+"""
+Live seat counts pushed to browsers over Server-Sent Events.
+
+When a booking or cancellation commits, the new ``available_seats`` of the
+departure is published to the broker named by SEAT_FEED_BROKER. The default
+InProcessBroker fans each message out to every watcher in this process: one
+hop onto each event loop per message, however many watchers are waiting on
+that loop. Only the latest count matters, so a watcher that falls behind
+skips straight to the newest value instead of queueing.
+
+A broker for several processes (e.g. Redis pub/sub) implements the same
+two methods and, in each process, re-publishes what it receives to a local
+InProcessBroker:
+
+    publish(travel_pk, message)        callable from any thread
+    subscribe(travel_pk) -> Subscription with ``await get(timeout)`` and ``close()``
+
+Streams need an ASGI server. Under WSGI Django reads an async streaming
+response to its end before sending any of it, so a stream would hold a
+worker for SEAT_FEED_MAX_SECONDS and deliver nothing; pages then don't
+subscribe, and the endpoint answers with the current count only.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    def __init__(self, broker, travel_pk, loop):
+        self.broker = broker
+        self.travel_pk = travel_pk
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def deliver(self, message):
+        # Runs on the subscription's own loop; keep only the newest message
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Next message, or None if none arrives within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # travel_pk -> loop -> subscriptions on that loop
+        self._topics = {}
+
+    def subscribe(self, travel_pk):
+        subscription = Subscription(self, travel_pk, asyncio.get_running_loop())
+        with self._lock:
+            self._topics.setdefault(travel_pk, {}).setdefault(subscription.loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            loops = self._topics.get(subscription.travel_pk, {})
+            watchers = loops.get(subscription.loop)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del loops[subscription.loop]
+            if not loops:
+                self._topics.pop(subscription.travel_pk, None)
+
+    def publish(self, travel_pk, message):
+        with self._lock:
+            targets = [(loop, list(watchers)) for loop, watchers in self._topics.get(travel_pk, {}).items()]
+        for loop, watchers in targets:
+            try:
+                loop.call_soon_threadsafe(_fan_out, watchers, message)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def watcher_count(self, travel_pk=None):
+        with self._lock:
+            topics = [self._topics.get(travel_pk, {})] if travel_pk is not None else self._topics.values()
+            return sum(len(watchers) for loops in topics for watchers in loops.values())
+
+
+def _fan_out(watchers, message):
+    for subscription in watchers:
+        subscription.deliver(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'SEAT_FEED_BROKER', 'travel.utils.seat_feed.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_seats(travel_pk, available_seats):
+    get_broker().publish(travel_pk, {'available_seats': available_seats})
+
+
+# Reconnect delay sent with the non-streaming WSGI answer
+SNAPSHOT_RETRY_MS = 60000
+
+
+def streaming_supported(request):
+    """True when the request is served over ASGI, where seat streams work"""
+    return isinstance(request, ASGIRequest)
+
+
+def _event(message, event='seats'):
+    return f'event: {event}\ndata: {json.dumps(message)}\n\n'
+
+
+async def seat_events(travel_pk, current_seats):
+    """
+    SSE stream for one departure. ``current_seats`` is an async callable
+    returning the count from the database; it is read after subscribing so
+    no change can slip between the two. The stream ends after
+    SEAT_FEED_MAX_SECONDS and the browser reconnects by itself.
+    """
+    heartbeat = getattr(settings, 'SEAT_FEED_HEARTBEAT_SECONDS', 15)
+    deadline = time.monotonic() + getattr(settings, 'SEAT_FEED_MAX_SECONDS', 300)
+    subscription = get_broker().subscribe(travel_pk)
+    try:
+        yield 'retry: 3000\n\n'
+        yield _event({'available_seats': await current_seats()})
+        while time.monotonic() < deadline:
+            message = await subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            yield _event(message) if message is not None else ': ping\n\n'
+    finally:
+        subscription.close()
+
+
+def seat_snapshot(available_seats):
+    """The whole response under WSGI: the current count and a slow reconnect"""
+    return f'retry: {SNAPSHOT_RETRY_MS}\n\n' + _event({'available_seats': available_seats})
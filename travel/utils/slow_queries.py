@@ -0,0 +1,168 @@
+"""
+Slow-query log.
+
+An execute wrapper installed on every database connection times each
+statement. Statements slower than SLOW_QUERY_THRESHOLD_MS are logged to the
+``travel.slow_queries`` logger together with the view that ran them, their
+normalised SQL and the database's EXPLAIN plan, and kept in a bounded
+in-process ring buffer shown on the staff dashboard. Plans that scan a whole
+table listed in SLOW_QUERY_WATCH_TABLES are flagged.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .query_tracking import sql_shape
+
+
+logger = logging.getLogger('travel.slow_queries')
+
+# URL name of the view currently being served, set by SlowQueryLogMiddleware
+current_view = ContextVar('travel_slow_query_view', default=None)
+
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+# SQLite: "SCAN travel_booking" (a "SCAN ... USING INDEX" walks an index instead)
+_SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?(?! USING)', re.IGNORECASE)
+# PostgreSQL: "Seq Scan on travel_booking"
+_POSTGRES_SCAN = re.compile(r'\bSeq Scan on "?(\w+)"?')
+
+
+def slow_query_enabled():
+    return getattr(settings, 'SLOW_QUERY_LOG_ENABLED', True)
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+
+
+def watched_tables():
+    return getattr(settings, 'SLOW_QUERY_WATCH_TABLES', ('travel_traveloption', 'travel_booking'))
+
+
+class SlowQueryLog:
+    """Thread-safe ring buffer of the most recent slow queries"""
+
+    def __init__(self, size=None):
+        self._size = size
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _buffer(self):
+        if self._entries is None:
+            self._entries = deque(maxlen=self._size or getattr(settings, 'SLOW_QUERY_LOG_SIZE', 100))
+        return self._entries
+
+    def add(self, entry):
+        with self._lock:
+            self._buffer().append(entry)
+
+    def entries(self):
+        """Newest first"""
+        with self._lock:
+            return list(reversed(self._buffer()))
+
+    def clear(self):
+        with self._lock:
+            self._buffer().clear()
+
+
+slow_log = SlowQueryLog()
+_explaining = threading.local()
+
+
+def full_scans(plan, columns=None):
+    """Watched tables that the plan reads in full"""
+    tables = set()
+    if columns and 'type' in columns and 'table' in columns:
+        # MySQL tabular EXPLAIN: access type ALL is a full table scan
+        table_at, type_at = columns.index('table'), columns.index('type')
+        tables.update(row[table_at] for row in plan if row[type_at] == 'ALL')
+    else:
+        for line in plan:
+            text = line if isinstance(line, str) else ' '.join(str(part) for part in line)
+            tables.update(_SQLITE_SCAN.findall(text))
+            tables.update(_POSTGRES_SCAN.findall(text))
+    return sorted(tables & set(watched_tables()))
+
+
+def explain(connection, sql, params):
+    """
+    Return (plan lines, flagged tables) for a statement. Uses a bare backend
+    cursor so the EXPLAIN does not pass through the execute wrappers again or
+    count towards the request's queries.
+    """
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params or ())
+        rows = cursor.fetchall()
+        columns = [col[0] for col in cursor.description or ()]
+    finally:
+        cursor.close()
+    flagged = full_scans(rows, columns)
+    if connection.vendor == 'sqlite':
+        # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+        lines = [row[-1] for row in rows]
+    elif len(columns) == 1:
+        lines = [row[0] for row in rows]
+    else:
+        lines = [' | '.join(f'{c}={v}' for c, v in zip(columns, row)) for row in rows]
+    return lines, flagged
+
+
+def record(connection, sql, params, duration):
+    plan, flagged, error = [], [], ''
+    if sql.lstrip().upper().startswith(_EXPLAINABLE):
+        _explaining.active = True
+        try:
+            plan, flagged = explain(connection, sql, params)
+        except DatabaseError as exc:
+            error = str(exc)
+        finally:
+            _explaining.active = False
+
+    entry = {
+        'at': timezone.now(),
+        'view': current_view.get() or '-',
+        'alias': connection.alias,
+        'duration_ms': round(duration * 1000, 2),
+        'sql': sql_shape(sql),
+        'plan': plan,
+        'full_scans': flagged,
+        'explain_error': error,
+    }
+    slow_log.add(entry)
+    logger.warning(
+        'Slow query (%.1f ms) in %s%s: %s\n%s',
+        entry['duration_ms'], entry['view'],
+        f" [full scan: {', '.join(flagged)}]" if flagged else '',
+        entry['sql'], '\n'.join(plan),
+    )
+    return entry
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    if (
+        not many
+        and duration * 1000 >= threshold_ms()
+        and not getattr(_explaining, 'active', False)
+    ):
+        record(context['connection'], sql, params, duration)
+    return result
+
+
+def install(sender=None, connection=None, **kwargs):
+    """connection_created receiver adding the wrapper to each new connection"""
+    if slow_query_enabled() and slow_query_wrapper not in connection.execute_wrappers:
+        # Insert at the front: the connection may be opened inside an
+        # execute_wrapper() block, which pops the last wrapper on exit.
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
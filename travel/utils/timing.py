@@ -0,0 +1,32 @@
+"""
+Timing hooks for slow, non-database steps such as sending email or
+rendering PDFs. Wrapped code sends ``step_timed`` with the step name and
+its duration; the metrics module listens, and so can anything else.
+"""
+import functools
+import time
+
+from django.dispatch import Signal
+
+
+# Sent with step=<name>, duration=<seconds>, failed=<bool>
+step_timed = Signal()
+
+
+def timed_step(name):
+    """Decorator timing every call of the wrapped function as ``name``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                step_timed.send(
+                    sender=func, step=name, duration=time.perf_counter() - started, failed=failed
+                )
+        return wrapper
+    return decorator
@@ -1,17 +1,31 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from .models import TravelOption, Booking
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from .models import ArchivedTravelOption, TravelOption, Booking
 from .forms import BookingForm, UserRegisterForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Min, Count
+from django.db.models.functions import TruncDate
 from django.contrib.auth import login
 from django.contrib.auth import logout
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, timedelta
+from .metrics import render_prometheus
 from .utils.email_utils import send_booking_confirmation_email, send_cancellation_email
 from .utils.pdf_utils import generate_ticket_pdf, generate_cancellation_receipt_pdf
+from .utils.connections import planner
+from .utils import fare_calendar, price_history, schedules
+from .utils.autocomplete import cities
+from .utils.booking_history import get_booking_page
+from .utils.archive import find_booking
+from .utils.seat_feed import seat_events, seat_snapshot, streaming_supported
+from .utils.search import search_travel_options, matching_schedules, available_sorts, resolve_sort, UnsupportedSearch, SORT_LABELS, DEFAULT_SORT
 
 def index(request):
     recent = TravelOption.objects.order_by('-departure_datetime')[:6]
@@ -22,40 +36,202 @@ def logout_view(request):
     messages.info(request, "You have been logged out.")
     return redirect("travel:index")
 
-def travel_list(request):
-    qs = TravelOption.objects.all().order_by('departure_datetime')
-    ttype = request.GET.get('type')
-    src = request.GET.get('source')
-    dst = request.GET.get('destination')
-    date = request.GET.get('date')
-    q = request.GET.get('q')
-
-    if ttype:
-        qs = qs.filter(type__iexact=ttype)
-    if src:
-        qs = qs.filter(source__icontains=src)
-    if dst:
-        qs = qs.filter(destination__icontains=dst)
-    if date:
-        qs = qs.filter(departure_datetime__date=date)
-    if q:
-        qs = qs.filter(
-            Q(source__icontains=q) |
-            Q(destination__icontains=q) |
-            Q(travel_id__icontains=q)
+FLEX_CHOICES = [1, 2, 3, 7]
+
+async def _arender(request, template_name, context):
+    """
+    render() for async views. The user is loaded up front with auser(), so
+    templates reading ``user`` don't run a synchronous query on the event loop.
+    """
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
+async def _cheapest_per_day(qs, day, flex):
+    """One grouped query over the whole window: cheapest fare and count per day"""
+    rows = {
+        row['day']: row
+        async for row in qs.order_by().annotate(day=TruncDate('departure_datetime')).values('day').annotate(
+            min_price=Min('price'), departures=Count('id')
+        )
+    }
+    days = []
+    for offset in range(-flex, flex + 1):
+        current = day + timedelta(days=offset)
+        row = rows.get(current, {})
+        days.append({
+            'date': current,
+            'min_price': row.get('min_price'),
+            'departures': row.get('departures', 0),
+            'selected': offset == 0,
+        })
+    priced = [d['min_price'] for d in days if d['min_price'] is not None]
+    cheapest = min(priced) if priced else None
+    for d in days:
+        d['cheapest'] = cheapest is not None and d['min_price'] == cheapest
+    return days
+
+async def travel_list(request):
+    try:
+        qs, day, flex = search_travel_options(request.GET)
+    except UnsupportedSearch as e:
+        return HttpResponseBadRequest(str(e))
+    sort = resolve_sort(request.GET)
+    if sort != (request.GET.get('sort') or DEFAULT_SORT):
+        messages.info(request, f'Date searches are sorted by {SORT_LABELS[sort].lower()}.')
+
+    # Departures of recurring schedules are created the first time they are searched
+    await sync_to_async(schedules.ensure_materialized)(schedules.window_end())
+    if day:
+        # Past the rolling window, only the searched days of the searched route
+        await sync_to_async(schedules.ensure_dates)(
+            day - timedelta(days=flex), day + timedelta(days=flex + 1), matching_schedules(request.GET)
         )
+    flex_days = await _cheapest_per_day(qs, day, flex) if flex else None
 
+    # Count and fetch with the async ORM; the paginator then does no queries
     paginator = Paginator(qs, 9)
-    page = request.GET.get('page')
-    travels = paginator.get_page(page)
-    return render(request, 'travel/travel_list.html', {'travels': travels, 'q': q})
+    paginator.count = await qs.acount()
+    travels = paginator.get_page(request.GET.get('page'))
+    travels.object_list = [travel async for travel in travels.object_list]
+    return await _arender(request, 'travel/travel_list.html', {
+        'travels': travels,
+        'q': request.GET.get('q'),
+        'flex_days': flex_days,
+        'flex_choices': FLEX_CHOICES,
+        'sort': sort,
+        'sort_options': [(key, SORT_LABELS[key]) for key in available_sorts(request.GET)],
+    })
 
-def travel_detail(request, pk):
-    travel = get_object_or_404(TravelOption, pk=pk)
-    return render(request, 'travel/travel_detail.html', {'travel': travel})
+async def connection_search(request):
+    """JSON: fastest and cheapest itineraries, including connections"""
+    src = (request.GET.get('source') or '').strip()
+    dst = (request.GET.get('destination') or '').strip()
+    if not src or not dst:
+        return JsonResponse({'error': 'source and destination are required.'}, status=400)
+
+    try:
+        date = parse_date(request.GET.get('date') or '')
+        max_legs = max(1, min(int(request.GET.get('max_legs', 3)), 4))
+        min_transfer = int(request.GET['min_transfer']) if request.GET.get('min_transfer') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date, max_legs or min_transfer.'}, status=400)
+    if min_transfer is not None and min_transfer < 0:
+        return JsonResponse({'error': 'min_transfer cannot be negative.'}, status=400)
+
+    earliest = timezone.now()
+    if date:
+        earliest = max(earliest, timezone.make_aware(datetime.combine(date, datetime.min.time())))
+
+    # The planner graph only spans CONNECTION_HORIZON_DAYS, inside the rolling window
+    await sync_to_async(schedules.ensure_materialized)(schedules.window_end())
+    # The planner may refresh its graph from the database first
+    result = await sync_to_async(planner.search)(src, dst, earliest=earliest, max_legs=max_legs,
+                                                 min_transfer_minutes=min_transfer)
+    return JsonResponse(result.as_dict())
+
+async def fare_calendar_view(request):
+    """JSON: cheapest fare and seats left per day on a route"""
+    src = (request.GET.get('source') or '').strip()
+    dst = (request.GET.get('destination') or '').strip()
+    if not src or not dst:
+        return JsonResponse({'error': 'source and destination are required.'}, status=400)
+
+    ttype = (request.GET.get('type') or '').upper() or None
+    try:
+        days = max(1, min(int(request.GET.get('days', fare_calendar.calendar_days())),
+                          fare_calendar.calendar_days()))
+    except ValueError:
+        return JsonResponse({'error': 'days must be an integer.'}, status=400)
+
+    await sync_to_async(schedules.ensure_materialized)(schedules.window_end(days=days))
+    calendar = await sync_to_async(fare_calendar.get_calendar)(src, dst, type=ttype, days=days)
+    return JsonResponse({
+        'source': src,
+        'destination': dst,
+        'type': ttype,
+        'days': [
+            {
+                'date': entry['date'].isoformat(),
+                'min_price': str(entry['min_price']) if entry['min_price'] is not None else None,
+                'available_seats': entry['available_seats'],
+                'departures': entry['departures'],
+            }
+            for entry in calendar
+        ],
+    })
+
+async def city_autocomplete(request):
+    """JSON: city and station names starting with ``q``, busiest first"""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    # Only queries the database when the index is built or rebuilt
+    matches = await sync_to_async(cities.lookup)(request.GET.get('q') or '', limit)
+    return JsonResponse({
+        'results': [{'name': name, 'departures': count} for name, count in matches],
+    })
+
+async def route_price_history(request):
+    """JSON: lowest fare in effect on a route per day over the last ``days`` days"""
+    src = (request.GET.get('source') or '').strip()
+    dst = (request.GET.get('destination') or '').strip()
+    if not src or not dst:
+        return JsonResponse({'error': 'source and destination are required.'}, status=400)
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 366))
+    except ValueError:
+        return JsonResponse({'error': 'days must be an integer.'}, status=400)
+
+    minima = await sync_to_async(price_history.route_daily_min)(src, dst, days=days)
+    return JsonResponse({
+        'source': src,
+        'destination': dst,
+        'days': [{'date': day.isoformat(), 'min_price': f'{price:.2f}'} for day, price in minima],
+    })
+
+async def travel_price_history(request, pk):
+    """JSON: every recorded price of a departure, live or archived"""
+    prices = await sync_to_async(price_history.series)(pk)
+    if not prices and not (
+        await TravelOption.objects.filter(pk=pk).aexists()
+        or await ArchivedTravelOption.objects.filter(pk=pk).aexists()
+    ):
+        raise Http404('No TravelOption matches the given query.')
+    return JsonResponse({
+        'travel_option': pk,
+        'prices': [{'at': at.isoformat(), 'price': f'{price:.2f}'} for at, price in prices],
+    })
+
+async def travel_detail(request, pk):
+    travel = await aget_object_or_404(TravelOption, pk=pk)
+    return await _arender(request, 'travel/travel_detail.html', {
+        'travel': travel,
+        'live_seats': streaming_supported(request),
+    })
+
+async def seat_stream(request, pk):
+    """Server-Sent Events: the departure's seat count, pushed on every change"""
+    seats = TravelOption.objects.filter(pk=pk).values_list('available_seats', flat=True)
+    if not await seats.aexists():
+        raise Http404('No TravelOption matches the given query.')
+    if streaming_supported(request):
+        response = StreamingHttpResponse(seat_events(pk, seats.aget), content_type='text/event-stream')
+    else:
+        # A WSGI worker would buffer the whole stream; answer with the current count
+        response = HttpResponse(seat_snapshot(await seats.aget()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+def _send_email(send, booking):
+    try:
+        send(booking)
+    except Exception as email_error:
+        # Don't fail the booking if email fails
+        print(f"Email notification failed: {email_error}")
 
 @login_required
-@transaction.atomic
 def book_travel(request, pk):
     travel = get_object_or_404(TravelOption, pk=pk)
     
@@ -68,47 +244,53 @@ def book_travel(request, pk):
         form = BookingForm(request.POST, travel_option=travel)
         if form.is_valid():
             seats = form.cleaned_data['number_of_seats']
-            travel_locked = TravelOption.objects.select_for_update().get(pk=travel.pk)
-            
-            # Double-check availability with locked record
-            if seats > travel_locked.available_seats:
-                form.add_error('number_of_seats', f'Only {travel_locked.available_seats} seats left.')
-            else:
-                try:
-                    total = seats * travel_locked.price
-                    booking = Booking.objects.create(
-                        user=request.user,
-                        travel_option=travel_locked,
-                        number_of_seats=seats,
-                        total_price=total,
-                    )
-                    travel_locked.available_seats -= seats
-                    travel_locked.save()
-                    
-                    # Send confirmation email
-                    try:
-                        send_booking_confirmation_email(booking)
-                    except Exception as email_error:
-                        # Don't fail the booking if email fails
-                        print(f"Email notification failed: {email_error}")
+            # Only the write takes a transaction: on SQLite it begins IMMEDIATE
+            # and holds the write lock, which rendering the form must not
+            try:
+                with transaction.atomic():
+                    travel_locked = TravelOption.objects.select_for_update().get(pk=travel.pk)
                     
+                    # Double-check availability with locked record
+                    booking = None
+                    if seats <= travel_locked.available_seats:
+                        total = seats * travel_locked.price
+                        booking = Booking.objects.create(
+                            user=request.user,
+                            travel_option=travel_locked,
+                            number_of_seats=seats,
+                            total_price=total,
+                            unit_price=travel_locked.price,
+                        )
+                        travel_locked.available_seats -= seats
+                        travel_locked.save()
+                        
+                        # Send confirmation email once the seats are committed,
+                        # so the write lock is not held while talking to SMTP
+                        transaction.on_commit(lambda: _send_email(send_booking_confirmation_email, booking))
+            except Exception as e:
+                messages.error(request, f'Booking failed: {str(e)}')
+            else:
+                if booking is None:
+                    form.add_error('number_of_seats', f'Only {travel_locked.available_seats} seats left.')
+                else:
                     messages.success(request, f'Booking confirmed! ID: {booking.booking_id}. Check your email for confirmation.')
                     return redirect('travel:my_bookings')
-                except Exception as e:
-                    messages.error(request, f'Booking failed: {str(e)}')
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
         form = BookingForm(travel_option=travel)
-    return render(request, 'travel/booking_form.html', {'form': form, 'travel': travel})
+    return render(request, 'travel/booking_form.html', {
+        'form': form,
+        'travel': travel,
+        'live_seats': streaming_supported(request),
+    })
 
 @login_required
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-booking_date')
+    bookings = get_booking_page(request.user, cursor=request.GET.get('after'))
     return render(request, 'travel/bookings_list.html', {'bookings': bookings})
 
 @login_required
-@transaction.atomic
 def cancel_booking(request, pk):
     booking = get_object_or_404(Booking, pk=pk, user=request.user)
     
@@ -143,22 +325,25 @@ def cancel_booking(request, pk):
     
     # If POST request, process the cancellation
     elif request.method == 'POST':
-        travel = TravelOption.objects.select_for_update().get(pk=booking.travel_option.pk)
-        travel.available_seats += booking.number_of_seats
-        travel.save()
-        
-        booking.status = 'CANCELLED'
-        booking.cancelled_at = timezone.now()
-        booking.refund_amount = refund_amount
-        # Get cancellation reason from POST or GET, default to standard message
-        booking.cancellation_reason = request.POST.get('reason') or 'User requested cancellation'
-        booking.save()
-        
-        # Send cancellation email
-        try:
-            send_cancellation_email(booking)
-        except Exception as email_error:
-            print(f"Cancellation email failed: {email_error}")
+        with transaction.atomic():
+            # Re-read under the lock so a double submit restores the seats once
+            booking = Booking.objects.select_for_update().get(pk=booking.pk)
+            if booking.status == 'CANCELLED':
+                messages.info(request, 'Booking already cancelled.')
+                return redirect('travel:my_bookings')
+            travel = TravelOption.objects.select_for_update().get(pk=booking.travel_option_id)
+            travel.available_seats += booking.number_of_seats
+            travel.save()
+            
+            booking.status = 'CANCELLED'
+            booking.cancelled_at = timezone.now()
+            booking.refund_amount = refund_amount
+            # Get cancellation reason from POST or GET, default to standard message
+            booking.cancellation_reason = request.POST.get('reason') or 'User requested cancellation'
+            booking.save()
+            
+            # Send cancellation email after commit
+            transaction.on_commit(lambda: _send_email(send_cancellation_email, booking))
         
         if refund_amount > 0:
             messages.success(request, f'Booking cancelled successfully! Refund of ${refund_amount:.2f} will be processed within 5-7 business days.')
@@ -167,6 +352,16 @@ def cancel_booking(request, pk):
         
         return redirect('travel:my_bookings')
 
+def metrics(request):
+    """Prometheus text exposition; superusers, or a scraper holding METRICS_TOKEN"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorised = request.user.is_active and request.user.is_superuser
+    if not authorised and token:
+        authorised = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorised:
+        return HttpResponseForbidden('Superuser access required.')
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
@@ -182,7 +377,9 @@ def register(request):
 @login_required
 def download_ticket(request, pk):
     """Download PDF ticket for a confirmed booking"""
-    booking = get_object_or_404(Booking, pk=pk, user=request.user)
+    booking = find_booking(request.user, pk)
+    if booking is None:
+        raise Http404('No booking matches the given query.')
     
     if booking.status != 'CONFIRMED':
         messages.error(request, 'Ticket is only available for confirmed bookings.')
@@ -200,7 +397,9 @@ def download_ticket(request, pk):
 @login_required
 def download_cancellation_receipt(request, pk):
     """Download PDF receipt for a cancelled booking"""
-    booking = get_object_or_404(Booking, pk=pk, user=request.user)
+    booking = find_booking(request.user, pk)
+    if booking is None:
+        raise Http404('No booking matches the given query.')
     
     if booking.status != 'CANCELLED':
         messages.error(request, 'Receipt is only available for cancelled bookings.')
@@ -2,5 +2,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_booking.settings')
+# Persistent connections are kept per async context under ASGI and leak
+# instead of being reused, so open one per request unless told otherwise
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+from travel.utils.autocomplete import cities  # noqa: E402
+
+cities.warm()
@@ -29,13 +29,18 @@ INSTALLED_APPS = [
 # Middleware
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # Add this for static files
+    "travel.middleware.StaticFilesMiddleware",  # WhiteNoise, async-capable
+    "travel.middleware.MetricsMiddleware",  # Outermost app middleware so timings cover the rest
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "travel.middleware.ProfilerMiddleware",  # Needs request.user
+    "travel.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "travel.middleware.QueryInspectorMiddleware",
+    "travel.middleware.SlowQueryLogMiddleware",
 ]
 
 ROOT_URLCONF = "travel_booking.urls"
@@ -43,7 +48,8 @@ ROOT_URLCONF = "travel_booking.urls"
 # Templates
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Standard Django backend, with render timing for /metrics
+        "BACKEND": "travel.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "travel" / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -64,6 +70,11 @@ ASGI_APPLICATION = "travel_booking.asgi.application"
 USE_MYSQL = os.environ.get("USE_MYSQL", "0") == "1"
 
 if USE_MYSQL:
+    # Persistent connections: each worker thread keeps its connection for
+    # DB_CONN_MAX_AGE seconds instead of a new handshake per request, so a
+    # worker holds at most one connection per thread (gunicorn --threads
+    # bounds it). Health checks replace a connection the server dropped
+    # before it is reused. DB_CONN_MAX_AGE=0 restores per-request connections.
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.mysql",
@@ -72,18 +83,103 @@ if USE_MYSQL:
             "PASSWORD": os.environ.get("MYSQL_PASSWORD", "mypassword"),
             "HOST": os.environ.get("MYSQL_HOST", "localhost"),
             "PORT": os.environ.get("MYSQL_PORT", "3306"),
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
             "OPTIONS": {
-                "init_command": "SET sql_mode='STRICT_TRANS_TABLES'"
+                "init_command": "SET sql_mode='STRICT_TRANS_TABLES'",
+                "connect_timeout": int(os.environ.get("MYSQL_CONNECT_TIMEOUT", "5")),
             },
         }
     }
+    if os.environ.get("MYSQL_REPLICA_HOST"):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": os.environ["MYSQL_REPLICA_HOST"],
+            "PORT": os.environ.get("MYSQL_REPLICA_PORT", DATABASES["default"]["PORT"]),
+            "TEST": {"MIRROR": "default"},
+        }
 else:
+    # SQLite tuned for several gunicorn workers writing at once: WAL lets
+    # readers run alongside the single writer, busy_timeout makes writers
+    # wait for the lock instead of failing with "database is locked", and
+    # IMMEDIATE transactions take the write lock at BEGIN, so booking and
+    # cancellation read seat counts already holding it (select_for_update()
+    # is a no-op on SQLite).
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
-            "NAME": BASE_DIR / "db.sqlite3",
+            "NAME": os.environ.get("SQLITE_PATH") or BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '20000'))};"
+                    "PRAGMA mmap_size=134217728;"  # 128 MB
+                    "PRAGMA cache_size=-20000;"  # ~20 MB page cache per connection
+                    "PRAGMA temp_store=MEMORY"
+                ),
+            },
         }
     }
+    # A second SQLite file (refreshed with `manage.py sync_sqlite_replica`)
+    # stands in for a read replica when developing locally.
+    if os.environ.get("SQLITE_REPLICA_PATH"):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "NAME": os.environ["SQLITE_REPLICA_PATH"],
+            "TEST": {"MIRROR": "default"},
+        }
+
+# Read replica routing (see travel/db_router.py): reads of these views go to
+# the "replica" alias when one is configured; a client that writes is pinned
+# to the primary for REPLICA_PIN_SECONDS so it sees its own changes.
+DATABASE_ROUTERS = ["travel.db_router.PrimaryReplicaRouter"]
+REPLICA_READ_VIEWS = {
+    "travel:list",
+    "travel:detail",
+    "travel:connections",
+    "travel:fare_calendar",
+    "travel:autocomplete",
+    "travel:admin_dashboard",
+    "travel:admin_bookings",
+    "travel:admin_users",
+    "travel:admin_travel_options",
+}
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "15"))
+
+# Cache: per-process memory by default. Set REDIS_URL when running several
+# workers so cache invalidation (e.g. booking history) reaches all of them.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Booking history: keyset page size and first-page cache lifetime
+BOOKING_HISTORY_PAGE_SIZE = int(os.environ.get("BOOKING_HISTORY_PAGE_SIZE", "20"))
+BOOKING_HISTORY_CACHE_SECONDS = 300
+
+# Recurring schedules (see travel/utils/schedules.py): departures are
+# materialized on demand for a rolling SCHEDULE_HORIZON_DAYS window; a dated
+# search further out (up to SCHEDULE_MAX_DAYS) adds only the searched days of
+# the searched route.
+SCHEDULE_HORIZON_DAYS = int(os.environ.get("SCHEDULE_HORIZON_DAYS", "60"))
+SCHEDULE_MAX_DAYS = 366
+SCHEDULE_CHECK_SECONDS = 60
+
+# Dynamic pricing (python manage.py reprice, see travel/utils/pricing.py).
+# Entries here override DEFAULT_RULES there, e.g. a steeper load-factor curve:
+# {"load_factor": [(0.0, 0.9), (0.7, 1.0), (1.0, 1.8)]}
+PRICING_RULES = {}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -129,3 +225,52 @@ EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.conso
 
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@travelbooking.com')
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
+
+# Query inspection: per-request query counts, N+1 warnings and budgets
+# (see travel/middleware.py). Budgets are also enforced by the test suite.
+QUERY_INSPECTOR_ENABLED = os.environ.get("QUERY_INSPECTOR_ENABLED", "1" if DEBUG else "0") == "1"
+N_PLUS_ONE_THRESHOLD = 5
+# Budgets count every query in the request, including the session and user
+# lookups made for logged-in users.
+QUERY_BUDGETS = {
+    "travel:index": 3,
+    # +1 for the recurring-schedule coverage check (at most once per SCHEDULE_CHECK_SECONDS)
+    "travel:list": 5,
+    "travel:detail": 3,
+    # +1 on the history pages for the archived bookings merged into them
+    "travel:my_bookings": 4,
+    "travel:booking_history": 4,
+    "travel:user_profile": 6,
+    # One query per dashboard figure; the 7-day trends are a single grouped query
+    "travel:admin_dashboard": 25,
+}
+
+# Request metrics exposed on /metrics (see travel/metrics.py). With several
+# gunicorn workers set METRICS_DIR to a directory shared by them (cleared on
+# start) so one scrape covers every worker.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = 1.0
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Slow-query log (see travel/utils/slow_queries.py): statements slower than
+# the threshold are logged with their EXPLAIN plan and kept in a per-process
+# ring buffer shown at /dashboard/slow-queries/.
+SLOW_QUERY_LOG_ENABLED = os.environ.get("SLOW_QUERY_LOG_ENABLED", "1") == "1"
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_SIZE = 100
+SLOW_QUERY_WATCH_TABLES = ("travel_traveloption", "travel_booking")
+
+# On-demand profiling: superusers add ?_profile=1 to any page to get a
+# cProfile + SQL report (see travel/utils/profiling.py). When disabled the
+# middleware is dropped from the chain at startup. Reports are also written
+# to PROFILER_DIR when set.
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "1" if DEBUG else "0") == "1"
+PROFILER_DIR = os.environ.get("PROFILER_DIR") or None
+
+# Live seat counts over Server-Sent Events (see travel/utils/seat_feed.py).
+# Streams are meant for ASGI workers (gunicorn_asgi.py); each ends after
+# SEAT_FEED_MAX_SECONDS and the browser reconnects.
+SEAT_FEED_BROKER = "travel.utils.seat_feed.InProcessBroker"
+SEAT_FEED_HEARTBEAT_SECONDS = 15
+SEAT_FEED_MAX_SECONDS = 300
@@ -4,3 +4,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_booking.settings')
 
 application = get_wsgi_application()
+
+from travel.utils.autocomplete import cities  # noqa: E402
+
+cities.warm()